@@ -1,21 +1,38 @@
-import display
 import buttons
-import machine
+import micropython
 import system
 import json
+import utime
 
-from .player import CHANNEL_COUNT, ROW_COUNT, Player, Track
-from .ui import Button, Controller, Focusable, NumberInput, View, Widget
+# time taken by each phase of startup, as (name, milliseconds); reported by
+# bench/startup.py
+startup_phases = []
+_phase_start = utime.ticks_ms()
 
-WAVEFORM_SINE = 0
-WAVEFORM_SQUARE = 1
-WAVEFORM_TRIANGLE = 2
-WAVEFORM_SAWTOOTH = 3
-WAVEFORM_NOISE = 4
 
+def startup_phase(name):
+    global _phase_start
+    now = utime.ticks_ms()
+    startup_phases.append((name, utime.ticks_diff(now, _phase_start)))
+    _phase_start = now
+
+
+from .library import TrackLibrary
+from .player import Player, Scheduler
+from .storage import Storage
+from .track import EFFECT_NONE, NO_PITCH, TONES, WAVEFORM_NOISE, WAVEFORM_SINE, Track
+from .ui import Button, Controller, Focusable, NumberInput, Sprite, View, Widget, screen
+
+startup_phase("imports")
 
 controller = Controller()
 
+# get something on screen before doing any of the slower work
+screen.drawFill(0xffffff)
+screen.drawText(10, 10, "Loading...", 0x000000)
+screen.flush()
+startup_phase("splash")
+
 
 track_data = """{
     "patterns": [
@@ -59,7 +76,7 @@ track_data = """{
             "waveform": 4,
             "volumes": [8, 6, 4, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
             "frequencies": [0, -10, -20, -30, -40, -50, -60, -70, -80, -90, -100, -110, -120, -130, -140, -150, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-        }
+        },
         "4": {
             "waveform": 4,
             "volumes": [8, 7, 6, 5, 4, 3, 2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
@@ -68,11 +85,35 @@ track_data = """{
     },
     "tempo": 5
 }"""
-track = Track.from_json(json.loads(track_data))
-print(json.dumps(track.to_json()))
-
+# edits are saved to flash as they are made, and replayed over the last saved
+# (or the built-in) track on startup; the built-in one is only parsed if there
+# is no saved track
+storage = Storage()
+track = storage.load(lambda: Track.from_json(json.loads(track_data)))
+library = TrackLibrary()
+startup_phase("track")
+
+# the mixer is only set up when playback first starts
 player = Player()
-player.load_track(track)
+
+
+def compact_storage(_=None):
+    # rewriting the snapshot takes long enough to upset playback, so it is
+    # only done while stopped
+    if not player.is_playing and storage.needs_compaction():
+        storage.compact(track)
+
+
+def save_edits():
+    # append the edits made since the last save to the journal, and compact
+    # it later if it has grown long
+    storage.flush()
+    if not player.is_playing and storage.needs_compaction():
+        try:
+            micropython.schedule(compact_storage, None)
+        except RuntimeError:
+            # schedule queue is full; the next save or stop will try again
+            pass
 
 
 class PlayButton(Button):
@@ -85,13 +126,31 @@ class PlayButton(Button):
             player.start()
 
 
+class SamplesButton(Button):
+    help_text = "press A to edit the sample of the selected row"
+
+    def __init__(self, label, x, y, step_sequencer_widget):
+        super().__init__(label, x, y)
+        self.width = 64
+        self.step_sequencer_widget = step_sequencer_widget
+
+    def on_press_a(self):
+        pattern = self.step_sequencer_widget.patterns[self.step_sequencer_widget.cursor_y]
+        sample_editor_view.edit(pattern.default_sample, pattern.default_pitch)
+
+
 class StepSequencerView(View):
-    def __init__(self, track):
+    def __init__(self, track, track_storage):
+        self.track = track
+        self.storage = track_storage
         self.step_sequencer_widget = StepSequencerWidget(track.patterns)
         self.play_button = PlayButton("Play", 10, 10)
+        self.samples_button = SamplesButton("Samples", 246, 10, self.step_sequencer_widget)
 
         def change_tempo(new_tempo):
-            track.tempo = new_tempo
+            self.track.tempo = new_tempo
+            self.storage.record_tempo(new_tempo)
+            save_edits()
 
         self.tempo_input = NumberInput(
             "Tempo", track.tempo, 60, 10,
@@ -100,153 +159,687 @@ class StepSequencerView(View):
             on_change=change_tempo,
         )
 
+        def change_fill_step(new_fill_step):
+            self.step_sequencer_widget.fill_step = new_fill_step
+
+        self.fill_input = NumberInput(
+            "Fill", self.step_sequencer_widget.fill_step, 150, 10,
+            min_value=1,
+            max_value=self.step_sequencer_widget.column_count,
+            on_change=change_fill_step,
+        )
+
         self.widgets = [
             self.play_button,
             self.tempo_input,
+            self.fill_input,
             self.step_sequencer_widget,
+            self.samples_button,
         ]
         super().__init__()
 
     def activate(self):
-        player.on_play_row(lambda row: self.step_sequencer_widget.highlight_column(row, flush=True))
+        widget = self.step_sequencer_widget
+
+        def on_row(row):
+            widget.highlight_column(row % widget.column_count, flush=True)
 
         def on_start():
             self.play_button.set_label("Stop")
-            display.flush()
-        player.on_start(on_start)
+            screen.flush()
 
         def on_stop():
-            self.step_sequencer_widget.unhighlight_column(flush=True)
+            widget.unhighlight_column(flush=True)
             self.play_button.set_label("Play")
-            display.flush()
+            screen.flush()
+            compact_storage()
+
+        self.callbacks = (on_row, on_start, on_stop)
+        player.on_play_row(on_row)
+        player.on_start(on_start)
         player.on_stop(on_stop)
 
-        self.play_button.on_focus()
+        # the player may have started or stopped while another view was shown;
+        # the label is drawn with the rest of the view after activating it
+        self.play_button.set_label("Stop" if player.is_playing else "Play", redraw=False)
+        if not player.is_playing:
+            widget.active_column = None
+        if self.active_widget:
+            self.active_widget.on_focus(None)
+
+    def deactivate(self):
+        for callback in self.callbacks:
+            player.remove_callback(callback)
+
+    def on_press_SELECT(self):
+        if self.step_sequencer_widget.holding_b:
+            self.step_sequencer_widget.on_press_SELECT()
+        else:
+            controller.set_view(library_view)
 
     def on_press_start(self):
-        if player.is_playing:
+        if self.step_sequencer_widget.holding_b:
+            self.step_sequencer_widget.randomise_pattern()
+        elif player.is_playing:
             player.stop()
         else:
             player.start()
 
-    def deactivate(self):
-        pass
-        # TODO: detach event handlers from player
+
+# number of rows of a pattern shown on screen at once
+VISIBLE_COLUMNS = 16
+
+
+# proportion of the rows set when randomising a pattern, in percent
+RANDOMISE_CHANCE = 25
+
+# filling a pattern sets every DEFAULT_FILL_STEP-th row, until changed with
+# the view's Fill input
+DEFAULT_FILL_STEP = 4
+
+# bits of a cell's look, which picks its sprite
+CELL_ON = 1
+CELL_HIGHLIGHTED = 2
+CELL_CURSOR = 4
+# a column past the end of the pattern
+CELL_EMPTY = 8
+
+cell_sprites = {}
+
+
+def cell_sprite(look):
+    # 16x16 sprites, covering a cell and the cursor's frame around it
+    sprite = cell_sprites.get(look)
+    if sprite is None:
+        colour = 0x00cc00 if look & CELL_HIGHLIGHTED else 0x000000
+        rects = [(0, 0, 16, 16, True, 0xffffff)]
+        if look & CELL_EMPTY:
+            pass
+        elif look & CELL_ON:
+            rects.append((1, 1, 15, 15, True, colour))
+        else:
+            rects.append((1, 1, 14, 14, False, colour))
+        if look & CELL_CURSOR:
+            rects.append((0, 0, 16, 16, False, 0x0000cc))
+        sprite = Sprite(16, 16, rects)
+        cell_sprites[look] = sprite
+    return sprite
 
 
 class StepSequencerWidget(Focusable, Widget):
-    help_text = "press A to toggle drum on / off"
+    help_text = "A toggles, B + move/A/SELECT/START edits"
 
     def __init__(self, patterns):
         self.patterns = patterns
+        # while B is held, moves and buttons edit the whole row under the
+        # cursor rather than moving it or toggling one cell
+        self.holding_b = False
+        self.clipboard = None
+        self.fill_step = DEFAULT_FILL_STEP
+        self.column_count = max(len(pattern) for pattern in patterns)
+        # the grid shows VISIBLE_COLUMNS columns starting at first_column
+        self.first_column = 0
         self.active_column = None
         self.cursor_x = 0
         self.cursor_y = 0
+        self.show_cursor = False
         super().__init__()
 
     def draw(self):
+        self.show_cursor = self.focused
         for y, pattern in enumerate(self.patterns):
-            display.drawText(
+            screen.drawText(
                 0,
                 87 + y*16,
                 pattern.label,
                 0x000000,
             )
 
-            for x, row in enumerate(pattern.rows):
-                self.render_cell(y, x, 0x000000)
-
-        if self.focused:
-            self.render_cursor(0x0000cc)
+            for x in range(self.first_column, self.first_column + VISIBLE_COLUMNS):
+                self.render_cell(y, x)
 
         super().draw()
 
-    def render_cell(self, y, x, colour):
-        if self.patterns[y].rows[x][0]:
-            display.drawRect(64 + x * 16, 88 + y * 16, 15, 15, True, colour)
-        else:
-            display.drawRect(64 + x * 16, 88 + y * 16, 15, 15, True, 0xffffff)
-            display.drawRect(64 + x * 16, 88 + y * 16, 14, 14, False, colour)
-
-    def render_column(self, x, colour):
-        for y, pattern in enumerate(self.patterns):
-            self.render_cell(y, x, colour)
+    def bounds(self):
+        return 0, 87, 63 + VISIBLE_COLUMNS * 16, len(self.patterns) * 16
+
+    def is_visible(self, x):
+        return self.first_column <= x < self.first_column + VISIBLE_COLUMNS
+
+    def cell_look(self, y, x):
+        # combination of the CELL_* bits
+        look = CELL_CURSOR if self.show_cursor and x == self.cursor_x and y == self.cursor_y else 0
+        if x >= len(self.patterns[y]):
+            return look | CELL_EMPTY
+        if x == self.active_column:
+            look |= CELL_HIGHLIGHTED
+        if self.patterns[y].is_set(x):
+            look |= CELL_ON
+        return look
+
+    def render_cell(self, y, x, look=None):
+        if look is None:
+            look = self.cell_look(y, x)
+        screen.drawSprite(63 + (x - self.first_column) * 16, 87 + y * 16, cell_sprite(look))
+
+    def render_column(self, x):
+        if self.is_visible(x):
+            for y in range(0, len(self.patterns)):
+                self.render_cell(y, x)
+
+    def set_first_column(self, first_column):
+        # scroll the grid, only redrawing the cells that look different at
+        # their new position
+        old_first_column = self.first_column
+        self.first_column = first_column
+        for column in range(0, VISIBLE_COLUMNS):
+            for y in range(0, len(self.patterns)):
+                new_look = self.cell_look(y, first_column + column)
+                if new_look != self.cell_look(y, old_first_column + column):
+                    self.render_cell(y, first_column + column, new_look)
 
     def unhighlight_column(self, flush=False):
         if self.active_column is not None:
-            self.render_column(self.active_column, 0x000000)
+            column = self.active_column
+            self.active_column = None
+            self.render_column(column)
         if flush:
-            display.flush()
+            screen.flush()
 
     def highlight_column(self, column, flush=False):
         if column != self.active_column:
             self.unhighlight_column()
             self.active_column = column
             if column is not None:
-                self.render_column(column, 0x00cc00)
+                self.render_column(column)
         if flush:
-            display.flush()
+            screen.flush()
 
-    def render_cursor(self, colour):
-        display.drawRect(63 + self.cursor_x * 16, 87 + self.cursor_y * 16, 16, 16, False, colour)
+    def render_cursor(self, show):
+        self.show_cursor = show
+        if self.is_visible(self.cursor_x):
+            self.render_cell(self.cursor_y, self.cursor_x)
 
     def set_cursor(self, x, y):
         if x == self.cursor_x and y == self.cursor_y:
             return
 
         # clear old cursor
-        self.render_cursor(0xffffff)
+        self.render_cursor(False)
         self.cursor_x = x
         self.cursor_y = y
+        if not self.is_visible(x):
+            self.set_first_column(x - x % VISIBLE_COLUMNS)
         # draw new cursor
-        self.render_cursor(0x0000cc)
-
-        display.flush()
+        self.render_cursor(True)
+
+    def on_move(self, button, count=1):
+        if self.holding_b:
+            if button == buttons.BTN_UP:
+                self.fill_pattern()
+            elif button == buttons.BTN_DOWN:
+                self.clear_pattern()
+            elif button == buttons.BTN_LEFT:
+                self.rotate_pattern(-count)
+            elif button == buttons.BTN_RIGHT:
+                self.rotate_pattern(count)
+            return True
 
-    def on_move(self, button):
         if button == buttons.BTN_UP:
             if self.cursor_y == 0:
                 return False
             else:
-                self.set_cursor(self.cursor_x, self.cursor_y - 1)
+                self.set_cursor(self.cursor_x, max(0, self.cursor_y - count))
         elif button == buttons.BTN_DOWN:
-            if self.cursor_y == CHANNEL_COUNT - 1:
+            if self.cursor_y == len(self.patterns) - 1:
                 return False
             else:
-                self.set_cursor(self.cursor_x, (self.cursor_y + 1) % CHANNEL_COUNT)
+                self.set_cursor(self.cursor_x, min(len(self.patterns) - 1, self.cursor_y + count))
         elif button == buttons.BTN_LEFT:
-            self.set_cursor((self.cursor_x - 1) % ROW_COUNT, self.cursor_y)
+            self.set_cursor((self.cursor_x - count) % self.column_count, self.cursor_y)
         elif button == buttons.BTN_RIGHT:
-            self.set_cursor((self.cursor_x + 1) % ROW_COUNT, self.cursor_y)
+            self.set_cursor((self.cursor_x + count) % self.column_count, self.cursor_y)
 
         return True
 
     def on_focus(self, button):
         if button in (buttons.BTN_LEFT, buttons.BTN_UP):
-            self.cursor_y = CHANNEL_COUNT - 1
+            self.cursor_y = len(self.patterns) - 1
         else:
             self.cursor_y = 0
         super().on_focus(button)
 
     def on_blur(self, button):
-        self.render_cursor(0xffffff)
+        self.holding_b = False
+        self.render_cursor(False)
         super().on_blur(button)
 
+    def edit_pattern(self, edit):
+        # apply edit to the pattern under the cursor, then recompile, save and
+        # redraw only the cells that it changed; flushing is left to the
+        # controller, so the whole edit shows up at once
+        y = self.cursor_y
+        pattern = self.patterns[y]
+        old_pitches = bytes(pattern.pitches)
+        old_sample_numbers = bytes(pattern.sample_numbers)
+        old_effects = bytes(pattern.effects)
+        old_effect_params = bytes(pattern.effect_params)
+        edit(pattern)
+
+        for x in range(0, len(pattern)):
+            if (
+                pattern.pitches[x] != old_pitches[x]
+                or pattern.sample_numbers[x] != old_sample_numbers[x]
+            ):
+                player.compiled.update_cell(y, x)
+                storage.record_cell(y, x, pattern)
+                if (old_pitches[x] != NO_PITCH) != pattern.is_set(x) and self.is_visible(x):
+                    self.render_cell(y, x)
+            # effects aren't compiled, so they only need saving
+            if (
+                pattern.effects[x] != old_effects[x]
+                or pattern.effect_params[x] != old_effect_params[x]
+            ):
+                storage.record_effect(y, x, pattern)
+        player.pattern_changed(y)
+        save_edits()
+
+    def fill_pattern(self):
+        # every fill_step-th row, lined up with the cursor
+        self.edit_pattern(lambda pattern: pattern.fill(
+            self.fill_step, self.cursor_x, pattern.default_pitch, pattern.default_sample
+        ))
+
+    def clear_pattern(self):
+        self.edit_pattern(lambda pattern: pattern.clear())
+
+    def rotate_pattern(self, amount):
+        self.edit_pattern(lambda pattern: pattern.rotate(amount))
+
+    def randomise_pattern(self):
+        self.edit_pattern(lambda pattern: pattern.randomise(
+            RANDOMISE_CHANCE, pattern.default_pitch, pattern.default_sample
+        ))
+
+    def copy_pattern(self):
+        self.clipboard = self.patterns[self.cursor_y].copy()
+
+    def paste_pattern(self):
+        if self.clipboard is not None:
+            self.edit_pattern(lambda pattern: pattern.paste(self.clipboard))
+
+    def on_press_b(self):
+        self.holding_b = True
+
+    def on_release_b(self):
+        self.holding_b = False
+
+    def on_press_SELECT(self):
+        if self.holding_b:
+            self.copy_pattern()
+
     def on_press_a(self):
+        if self.holding_b:
+            self.paste_pattern()
+            return
+
         pattern = self.patterns[self.cursor_y]
-        if pattern.rows[self.cursor_x][0]:
-            pattern.rows[self.cursor_x] = None, 0
+        if self.cursor_x >= len(pattern):
+            return
+        if pattern.is_set(self.cursor_x):
+            has_effect = pattern.effects[self.cursor_x] != EFFECT_NONE
+            pattern.clear_row(self.cursor_x)
+            if has_effect:
+                storage.record_effect(self.cursor_y, self.cursor_x, pattern)
+        else:
+            pattern.set_row(self.cursor_x, pattern.default_pitch, pattern.default_sample)
+        player.compiled.update_cell(self.cursor_y, self.cursor_x)
+        player.pattern_changed(self.cursor_y)
+        storage.record_cell(self.cursor_y, self.cursor_x, pattern)
+        save_edits()
+
+        self.render_cell(self.cursor_y, self.cursor_x)
+
+class TrackListWidget(Focusable, Widget):
+    help_text = "A: open track, SELECT: back"
+    # number of tracks listed on screen at once
+    visible_rows = 10
+
+    def __init__(self):
+        self.cursor = 0
+        self.first_row = 0
+        super().__init__()
+
+    def bounds(self):
+        return 0, 32, screen.width(), self.visible_rows * 16
+
+    def render_row(self, index):
+        if not self.first_row <= index < self.first_row + self.visible_rows:
+            return
+        y = 32 + (index - self.first_row) * 16
+        selected = index == self.cursor
+        screen.drawRect(0, y, screen.width(), 16, True, 0x000000 if selected else 0xffffff)
+        if index >= len(library.entries):
+            return
+        entry = library.entries[index]
+        colour = 0xffffff if selected else 0x000000
+        screen.drawText(4, y, entry.name, colour)
+        screen.drawText(
+            160, y, "%d patterns, tempo %d%s" % (
+                entry.pattern_count, entry.tempo, " *" if library.is_cached(entry.name) else ""
+            ), colour,
+        )
+
+    def draw(self):
+        screen.drawText(4, 8, "Tracks (* in memory)", 0x000000)
+        for index in range(self.first_row, self.first_row + self.visible_rows):
+            self.render_row(index)
+        super().draw()
+
+    def set_cursor(self, cursor):
+        if cursor == self.cursor:
+            return
+        old_cursor = self.cursor
+        self.cursor = cursor
+        first_row = cursor - cursor % self.visible_rows
+        if first_row != self.first_row:
+            self.first_row = first_row
+            self.draw()
+        else:
+            self.render_row(old_cursor)
+            self.render_row(cursor)
+
+    def on_move(self, button, count=1):
+        if not library.entries:
+            return True
+        if button == buttons.BTN_UP:
+            self.set_cursor(max(0, self.cursor - count))
+        elif button == buttons.BTN_DOWN:
+            self.set_cursor(min(len(library.entries) - 1, self.cursor + count))
+        return True
+
+    def on_press_a(self):
+        if self.cursor < len(library.entries):
+            open_track(library.entries[self.cursor].name)
+
+
+class LibraryView(View):
+    def __init__(self):
+        self.track_list = TrackListWidget()
+        self.widgets = [self.track_list]
+        super().__init__()
+
+    def activate(self):
+        # only the headers are read; tracks are loaded when opened
+        library.scan()
+        self.track_list.cursor = 0
+        self.track_list.first_row = 0
+        for index, entry in enumerate(library.entries):
+            if entry.name == storage.name:
+                self.track_list.set_cursor(index)
+        self.track_list.on_focus()
+
+    def on_press_SELECT(self):
+        controller.set_view(sequencer_view)
+
+
+# width of a bar of the envelope graphs, and height of a graph
+ENVELOPE_BAR_WIDTH = 9
+ENVELOPE_GRAPH_HEIGHT = 64
+
+# the loudest volume that can be set in the editor; the built-in samples go
+# up to 15
+MAX_EDIT_VOLUME = 15
+# frequency offsets are edited in steps of FREQUENCY_STEP Hz, between
+# -FREQUENCY_RANGE and FREQUENCY_RANGE
+FREQUENCY_STEP = 10
+FREQUENCY_RANGE = 320
+
+
+class EnvelopeWidget(Focusable, Widget):
+    # One envelope of a sample as a bar graph, with a cursor on one step.
+    # Only the bars that change are redrawn.
+    help_text = "hold A + up/down: change, START: play"
+
+    def __init__(self, label, y, min_value, max_value, step, on_change):
+        self.label = label
+        self.x = 32
+        self.y = y
+        self.min_value = min_value
+        self.max_value = max_value
+        self.step = step
+        # called with (step, value) after a step is changed
+        self.on_change = on_change
+        self.values = None
+        self.cursor = 0
+        self.holding_a = False
+        super().__init__()
+
+    def bounds(self):
+        return 0, self.y, screen.width(), ENVELOPE_GRAPH_HEIGHT
+
+    def set_values(self, values):
+        self.values = values
+        self.draw()
+
+    def value_y(self, value):
+        value = min(self.max_value, max(self.min_value, value))
+        return self.y + (self.max_value - value) * (ENVELOPE_GRAPH_HEIGHT - 1) // (
+            self.max_value - self.min_value
+        )
+
+    def render_bar(self, step):
+        x = self.x + step * ENVELOPE_BAR_WIDTH
+        show_cursor = self.focused and step == self.cursor
+        screen.drawRect(
+            x, self.y, ENVELOPE_BAR_WIDTH, ENVELOPE_GRAPH_HEIGHT, True,
+            0xdddddd if show_cursor else 0xffffff,
+        )
+        top = self.value_y(self.values[step])
+        zero = self.value_y(0)
+        screen.drawRect(
+            x + 1, min(top, zero), ENVELOPE_BAR_WIDTH - 2, abs(top - zero) + 1, True,
+            0x0000cc if show_cursor else 0x000000,
+        )
+
+    def draw(self):
+        screen.drawText(0, self.y, self.label, 0x000000)
+        if self.values is not None:
+            for step in range(0, len(self.values)):
+                self.render_bar(step)
+        super().draw()
+
+    def set_cursor(self, cursor):
+        if cursor == self.cursor:
+            return
+        old_cursor = self.cursor
+        self.cursor = cursor
+        self.render_bar(old_cursor)
+        self.render_bar(cursor)
+
+    def on_move(self, button, count=1):
+        if button == buttons.BTN_LEFT:
+            self.set_cursor(max(0, self.cursor - count))
+            return True
+        elif button == buttons.BTN_RIGHT:
+            self.set_cursor(min(len(self.values) - 1, self.cursor + count))
+            return True
+        elif not self.holding_a:
+            return False
+
+        old_value = self.values[self.cursor]
+        # a value outside the graph's range is only ever moved towards it
+        if button == buttons.BTN_UP:
+            value = max(old_value, min(self.max_value, old_value + count * self.step))
         else:
-            pattern.rows[self.cursor_x] = (pattern.default_pitch, pattern.default_sample)
+            value = min(old_value, max(self.min_value, old_value - count * self.step))
+        if value != old_value:
+            self.values[self.cursor] = value
+            self.render_bar(self.cursor)
+            self.on_change(self.cursor, value)
+        return True
 
-        self.render_cell(self.cursor_y, self.cursor_x, 0x000000)
+    def on_press_a(self):
+        self.holding_a = True
+
+    def on_release_a(self):
+        self.holding_a = False
+
+    # moving the focus only redraws the bar under the cursor, not the graph
+    def on_focus(self, button=None):
+        self.focused = True
+        self.render_bar(self.cursor)
+        self._show_help()
+
+    def on_blur(self, button=None):
+        self.focused = False
+        self.holding_a = False
+        self.render_bar(self.cursor)
+        self._hide_help()
+
+
+class SampleEditorView(View):
+    # Edits the volume and frequency envelopes of the current track's samples.
+    # Edits go straight into the compiled notes that the player plays, and
+    # are saved to the journal like any other.
+    def __init__(self):
+        self.sample_number = 1
+        self.sample_input = NumberInput(
+            "Sample", 1, 10, 10, min_value=1, on_change=self.set_sample,
+        )
+        self.waveform_input = NumberInput(
+            "Wave", 0, 110, 10,
+            min_value=WAVEFORM_SINE,
+            max_value=WAVEFORM_NOISE,
+            on_change=self.change_waveform,
+        )
+        self.pitch_input = NumberInput(
+            "Pitch", 40, 200, 10, min_value=0, max_value=len(TONES) - 1,
+        )
+        self.volume_graph = EnvelopeWidget(
+            "Vol", 40, 0, MAX_EDIT_VOLUME, 1, self.change_volume,
+        )
+        self.frequency_graph = EnvelopeWidget(
+            "Freq", 120, -FREQUENCY_RANGE, FREQUENCY_RANGE, FREQUENCY_STEP,
+            self.change_frequency,
+        )
+        self.widgets = [
+            self.sample_input,
+            self.waveform_input,
+            self.pitch_input,
+            self.volume_graph,
+            self.frequency_graph,
+        ]
+        super().__init__()
+
+    def edit(self, sample_number, pitch):
+        if sample_number in track.samples:
+            self.sample_number = sample_number
+        self.pitch_input.value = pitch
+        controller.set_view(self)
+
+    def activate(self):
+        # the track may have changed since the view was last shown
+        self.sample_input.max_value = max(track.samples)
+        self.load_sample()
+        if self.active_widget:
+            self.active_widget.on_focus(None)
+
+    def load_sample(self):
+        sample = track.samples[self.sample_number]
+        self.sample_input.set_value(self.sample_number)
+        self.waveform_input.set_value(sample.waveform)
+        self.pitch_input.set_value(self.pitch_input.value)
+        self.volume_graph.set_values(sample.volumes)
+        self.frequency_graph.set_values(sample.frequencies)
+
+    def set_sample(self, sample_number):
+        if sample_number in track.samples:
+            self.sample_number = sample_number
+            self.load_sample()
+
+    def sample_changed(self):
+        player.compiled.invalidate_sample(self.sample_number)
+        save_edits()
+        if not player.is_playing:
+            self.audition()
+
+    def change_waveform(self, waveform):
+        track.samples[self.sample_number].waveform = waveform
+        storage.record_waveform(self.sample_number, waveform)
+        self.sample_changed()
+
+    def change_volume(self, step, volume):
+        # the graph has already written the value to the sample
+        storage.record_volume(self.sample_number, step, volume)
+        self.sample_changed()
+
+    def change_frequency(self, step, frequency):
+        storage.record_frequency(self.sample_number, step, frequency)
+        self.sample_changed()
+
+    def audition(self):
+        player.audition(self.pitch_input.value, self.sample_number)
 
-sequencer_view = StepSequencerView(track)
+    def on_press_start(self):
+        self.audition()
+
+    def on_press_SELECT(self):
+        controller.set_view(sequencer_view)
+
+
+def open_track(name):
+    # switch to a track from the library, carrying on playing if the player is
+    global track, storage, sequencer_view
+    if name == storage.name:
+        controller.set_view(sequencer_view)
+        return
+
+    # opening a track may evict another from the cache, which can mean
+    # compacting it, and flash is only written while stopped
+    storage.flush()
+    was_playing = player.is_playing
+    if was_playing:
+        player.stop()
+    item = library.open(name)
+    if item is None:
+        if was_playing:
+            player.start()
+        return
+    if item.track is not track:
+        player.load_track(item.track, item.compiled)
+        track = item.track
+        storage = item.storage
+        if item.view is None:
+            item.view = StepSequencerView(track, storage)
+        sequencer_view = item.view
+    if was_playing:
+        player.start()
+    controller.set_view(sequencer_view)
+
+
+sequencer_view = StepSequencerView(track, storage)
+library_view = LibraryView()
+sample_editor_view = SampleEditorView()
 controller.set_view(sequencer_view)
+startup_phase("view")
+
+player.load_track(track)
+library.add(storage.name, track, storage, player.compiled).view = sequencer_view
+startup_phase("compile")
 
 
-timer = machine.Timer(1)
-timer.init(period=20, callback=lambda t: player.tick())
+# the audio timer is only armed while playing
+scheduler = Scheduler(player, timer_id=1)
 
 
 buttons.attach(buttons.BTN_HOME, lambda pressed: system.launcher())
+
+
+def main():
+    # Run the audio ticks, joystick repeat and drawing as tasks on one
+    # uasyncio loop, instead of from timer and button callbacks. Importing
+    # the app starts it on the callbacks and returns; call this afterwards
+    # to move it over to the runtime. Does not return.
+    from .runtime import create_runtime
+    create_runtime(player, scheduler, controller).start()
@@ -0,0 +1,71 @@
+"""
+Loads the real app package on CPython, with the firmware modules replaced by
+the stubs in bench/stubs and time driven by a virtual clock.
+"""
+import importlib.util
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(BENCH_DIR)
+STUBS_DIR = os.path.join(BENCH_DIR, 'stubs')
+
+if STUBS_DIR not in sys.path:
+    sys.path.insert(0, STUBS_DIR)
+
+import _clock  # noqa: E402
+import _counter  # noqa: E402
+import buttons  # noqa: E402
+import sndmixer  # noqa: E402
+import uasyncio  # noqa: E402
+
+
+def load_app(name='boogiebadge'):
+    # import (or re-import) the package, which runs its startup code against
+    # the stubs
+    for module_name in list(sys.modules):
+        if module_name == name or module_name.startswith(name + '.'):
+            del sys.modules[module_name]
+    _clock.reset()
+    _counter.reset()
+    sndmixer.reset()
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(PACKAGE_DIR, '__init__.py'),
+        submodule_search_locations=[PACKAGE_DIR],
+    )
+    app = importlib.util.module_from_spec(spec)
+    sys.modules[name] = app
+    spec.loader.exec_module(app)
+    return app
+
+
+def submodule(app, name):
+    # e.g. submodule(app, 'player'); app.player is the Player instance
+    return sys.modules[app.__name__ + '.' + name]
+
+
+def advance_ms(ms):
+    _clock.advance_ms(ms)
+
+
+def run_scheduled():
+    _clock.run_scheduled()
+
+
+def press(button, hold_ms=0):
+    buttons.press(button)
+    run_scheduled()
+    if hold_ms:
+        advance_ms(hold_ms)
+    buttons.release(button)
+    run_scheduled()
+
+
+def run_runtime(runtime, ms):
+    # run a runtime.Runtime for ms of virtual time
+    uasyncio.run(runtime.run(ms))
+
+
+call_counts = _counter.call_counts
+reset_counts = _counter.reset
+count_total = _counter.total
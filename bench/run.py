@@ -0,0 +1,307 @@
+"""
+Benchmarks for the player and UI, run on CPython against the stubbed firmware.
+
+    python bench/run.py [--ticks N]
+
+Timings are host wall-clock times and only meaningful relative to each other
+(e.g. before and after an engine change); call counts into the firmware
+modules are exact.
+"""
+import argparse
+import importlib
+import linecache
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import harness
+
+
+def measure(fn, iterations):
+    # returns (mean, max) cost of fn in microseconds
+    total = 0
+    worst = 0
+    for _ in range(0, iterations):
+        start = time.perf_counter_ns()
+        fn()
+        elapsed = time.perf_counter_ns() - start
+        total += elapsed
+        if elapsed > worst:
+            worst = elapsed
+    return total / iterations / 1000, worst / 1000
+
+
+def report(name, iterations, timing, counts):
+    mean, worst = timing
+    print("%-28s mean %8.1fus  max %8.1fus" % (name, mean, worst))
+    for call_name in sorted(counts):
+        print("    %-32s %8.2f / call" % (call_name, counts[call_name] / iterations))
+
+
+def bench(name, fn, iterations, setup=None):
+    if setup:
+        setup()
+    harness.reset_counts()
+    timing = measure(fn, iterations)
+    report(name, iterations, timing, dict(harness.call_counts))
+
+
+def bench_allocations(app, ticks, attributed_ticks=500):
+    # count the bytes allocated by each Player.tick, using tracemalloc in place
+    # of MicroPython's gc.mem_alloc, then attribute what was allocated to the
+    # lines of the app that allocated it. CPython allocates where MicroPython
+    # doesn't (boxed ints, iterators) and reuses some objects where it does,
+    # so only gc.mem_alloc on the badge shows the tick is allocation-free
+    player = app.player
+
+    class TracemallocMonitor(harness.submodule(app, 'player').AllocationMonitor):
+        # the peak traced size since the tick began, so that objects freed
+        # before the tick ends count too, as they do in gc.mem_alloc
+        def begin_tick(self):
+            tracemalloc.reset_peak()
+            super().begin_tick()
+
+        def allocated(self):
+            return tracemalloc.get_traced_memory()[1]
+
+    player.monitor = TracemallocMonitor()
+    tracemalloc.start()
+    try:
+        player.start()
+        for _ in range(0, ticks):
+            player.tick()
+            harness.run_scheduled()
+        player.stop()
+        harness.run_scheduled()
+    finally:
+        tracemalloc.stop()
+        monitor = player.monitor
+        player.monitor = None
+
+    print("%-28s %d of %d ticks allocated, %.1f bytes / tick, max %d bytes" % (
+        "Player.tick allocations", monitor.allocating_tick_count, monitor.tick_count,
+        monitor.allocated_bytes / monitor.tick_count, monitor.max_tick_bytes,
+    ))
+    print("%-28s %d collections, max %dus" % (
+        "garbage collection", monitor.gc_count, monitor.max_gc_us
+    ))
+
+    # CPython boxes integers above 256 where MicroPython uses small ints that
+    # live outside the heap, so a counter going up allocates here but not on
+    # the badge; listing the lines shows whether that is all there is. The
+    # listing compares snapshots taken around each tick, so unlike the count
+    # above it only sees blocks still allocated when the tick ends
+    blocks = {}
+    tracemalloc.start(16)
+    try:
+        player.start()
+        for _ in range(0, attributed_ticks):
+            before = tracemalloc.take_snapshot()
+            player.tick()
+            after = tracemalloc.take_snapshot()
+            harness.run_scheduled()
+            for stat in after.compare_to(before, 'traceback'):
+                if stat.size_diff <= 0:
+                    continue
+                frames = [
+                    frame for frame in stat.traceback
+                    if frame.filename.startswith(harness.PACKAGE_DIR + os.sep)
+                    and os.sep + 'bench' + os.sep not in frame.filename
+                ]
+                if not frames:
+                    # tracemalloc's own snapshots
+                    continue
+                frame = frames[-1]
+                key = (os.path.basename(frame.filename), frame.lineno, stat.size_diff)
+                blocks[key] = blocks.get(key, 0) + 1
+        player.stop()
+        harness.run_scheduled()
+    finally:
+        tracemalloc.stop()
+
+    # what a stub allocates counts against the line of the app calling it
+    print("    allocations over %d ticks, by line:" % attributed_ticks)
+    for (filename, lineno, size), count in sorted(blocks.items(), key=lambda item: -item[1]):
+        print("    %5d x %3d bytes  %s:%d  %s" % (
+            count, size, filename, lineno, linecache.getline(
+                os.path.join(harness.PACKAGE_DIR, filename), lineno
+            ).strip(),
+        ))
+
+
+def bench_voice_stealing(app, ticks, voice_count=2):
+    # every lane triggers on the first row, with fewer voices than lanes, so
+    # that voices are taken from one another
+    player_module = harness.submodule(app, 'player')
+    track = harness.submodule(app, 'track').Track.from_json(app.track.to_json())
+    for pattern in track.patterns:
+        pattern.set_row(0, pattern.default_pitch, pattern.default_sample)
+    player = player_module.Player(voice_count=voice_count)
+    player.gc_control = False
+    player.load_track(track)
+    player.start()
+    name = "Player.tick, %d voices" % voice_count
+    bench(name, player.tick, ticks)
+    player.stop()
+    harness.run_scheduled()
+    print("    %d allocations, %d steals" % (player.pool.allocation_count, player.pool.steal_count))
+
+
+def bench_tick_stats(app, ticks, lookahead):
+    # how evenly the work of Player.tick is spread over the ticks of a row
+    player = app.player
+
+    class WallClockTickStats(harness.submodule(app, 'player').TickStats):
+        def now_us(self):
+            return time.perf_counter_ns() // 1000
+
+    stats = WallClockTickStats(bucket_us=5)
+    player.monitor = stats
+    player.lookahead = lookahead
+    player.start()
+    for _ in range(0, ticks):
+        player.tick()
+        harness.run_scheduled()
+    player.stop()
+    harness.run_scheduled()
+    player.monitor = None
+    player.lookahead = True
+
+    name = "tick cost, lookahead %s" % ("on" if lookahead else "off")
+    print("%-28s row start avg %4dus max %5dus  all ticks avg %4dus max %5dus" % (
+        name, stats.row_start_average_us(), stats.row_start_max_us,
+        stats.average_us(), stats.max_us,
+    ))
+    print("    histogram (%dus buckets): %s" % (
+        stats.bucket_us, " ".join(str(count) for count in stats.histogram)
+    ))
+
+
+def bench_input(app):
+    # hold the joystick over the step sequencer, first with the UI keeping
+    # up, then with it stalled for the whole hold so that the moves pile up
+    controller = app.controller
+    widget = app.sequencer_view.step_sequencer_widget
+    if app.sequencer_view.active_widget is not widget:
+        sys.exit("bench_input: the step sequencer does not have the focus")
+    buttons = harness.buttons
+    controller.now_us = lambda: time.perf_counter_ns() // 1000
+    for stalled in (False, True):
+        controller.reset_stats()
+        controller.deferred = stalled
+        harness.reset_counts()
+        start_x = widget.cursor_x
+        harness.press(buttons.BTN_RIGHT, hold_ms=1500)
+        if stalled:
+            controller.process_events()
+        controller.deferred = False
+
+        name = "hold RIGHT 1.5s, UI %s" % ("stalled" if stalled else "keeping up")
+        print("%-28s cursor %d -> %d, %d batches, %d moves coalesced, %d flushes" % (
+            name, start_x, widget.cursor_x, controller.batch_count,
+            controller.coalesced_moves, harness.call_counts.get('display.flush', 0),
+        ))
+        print("    input-to-pixel latency avg %dus max %dus" % (
+            controller.average_latency_us(), controller.max_latency_us
+        ))
+    del controller.now_us
+
+
+def bench_storage(app, iterations):
+    # cost of saving one cell edit to the journal, against rewriting the
+    # whole track as a snapshot, on the host filesystem
+    storage_module = harness.submodule(app, 'storage')
+    pattern = app.track.patterns[0]
+    with tempfile.TemporaryDirectory() as directory:
+        storage = storage_module.Storage(directory)
+
+        def save_cell():
+            storage.record_cell(0, 0, pattern)
+            storage.flush()
+
+        report("save one edit to journal", iterations, measure(save_cell, iterations), {})
+        report(
+            "compact into snapshot", iterations,
+            measure(lambda: storage.compact(app.track), iterations), {},
+        )
+        if storage.journal is not None:
+            storage.journal.close()
+
+
+def bench_runtime(app, ms):
+    # play for ms of virtual time on the cooperative runtime, moving the
+    # cursor around on the way
+    runtime = importlib.import_module(app.__name__ + '.runtime').create_runtime(
+        app.player, app.scheduler, app.controller
+    )
+    buttons = harness.buttons
+    app.player.start()
+    harness.reset_counts()
+    elapsed = 0
+    while elapsed < ms:
+        buttons.press(buttons.BTN_RIGHT)
+        harness.run_runtime(runtime, 250)
+        buttons.release(buttons.BTN_RIGHT)
+        harness.run_runtime(runtime, 250)
+        elapsed += 500
+    app.player.stop()
+    harness.run_runtime(runtime, 100)
+
+    for task in runtime.tasks:
+        print("%-28s %6d runs, %d missed deadlines, max %dms late" % (
+            "runtime task '%s'" % task.name, task.run_count, task.missed_deadlines,
+            task.max_lateness_ms,
+        ))
+    print("    scheduler: %d ticks, %d caught up, %d dropped" % (
+        app.scheduler.tick_count, app.scheduler.caught_up_count, app.scheduler.dropped_count
+    ))
+    print("    display.flush: %d" % harness.call_counts['display.flush'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the boogiebadge player and UI")
+    parser.add_argument('--ticks', type=int, default=10000)
+    parser.add_argument('--draws', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = harness.load_app()
+    player = app.player
+    view = app.sequencer_view
+    widget = view.step_sequencer_widget
+
+    player.start()
+    harness.run_scheduled()
+    bench("Player.tick", player.tick, args.ticks)
+    player.stop()
+    harness.run_scheduled()
+
+    bench_voice_stealing(app, args.ticks)
+    bench_allocations(app, args.ticks)
+    bench_tick_stats(app, args.ticks, lookahead=False)
+    bench_tick_stats(app, args.ticks, lookahead=True)
+
+    bench("View.draw", view.draw, args.draws)
+
+    bench("StepSequencerWidget.draw", widget.draw, args.draws)
+
+    columns = iter(range(0, args.draws * 16))
+    bench(
+        "highlight_column + flush",
+        lambda: widget.highlight_column(next(columns) % 16, flush=True),
+        args.draws,
+    )
+
+    app.controller.set_view(view)
+    # from the buttons along the top down to the step sequencer
+    harness.press(harness.buttons.BTN_DOWN)
+    bench_input(app)
+    bench_storage(app, args.draws)
+
+    # switches the app over to the runtime for good, so this comes last
+    bench_runtime(app, 10000)
+
+
+if __name__ == '__main__':
+    main()
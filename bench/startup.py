@@ -0,0 +1,38 @@
+"""
+Measures the startup phases of the app on CPython.
+
+    python bench/startup.py [--runs N]
+
+The stub utime module normally follows the virtual clock, which does not move
+during startup, so the host's real clock is swapped in while the app loads.
+"""
+import argparse
+import time
+
+import harness
+import utime
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure boogiebadge startup time")
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    virtual_ticks_ms = utime.ticks_ms
+    utime.ticks_ms = lambda: time.perf_counter_ns() / 1000000
+    totals = {}
+    try:
+        for _ in range(0, args.runs):
+            app = harness.load_app()
+            for name, ms in app.startup_phases:
+                totals[name] = totals.get(name, 0) + ms
+    finally:
+        utime.ticks_ms = virtual_ticks_ms
+
+    for name, _ in app.startup_phases:
+        print("%-10s %8.3fms" % (name, totals[name] / args.runs))
+    print("%-10s %8.3fms" % ("total", sum(totals.values()) / args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# virtual clock shared by the stub modules. Time only moves when the harness
+# advances it, so that benchmarks and replays are deterministic.
+
+now_us = 0
+timers = []
+
+# micropython.schedule's queue, which like the firmware's has a fixed depth
+# and doesn't allocate
+SCHEDULE_DEPTH = 8
+scheduled_functions = [None] * SCHEDULE_DEPTH
+scheduled_args = [None] * SCHEDULE_DEPTH
+scheduled_start = 0
+scheduled_count = 0
+
+
+def schedule(function, arg):
+    global scheduled_count
+    if scheduled_count == SCHEDULE_DEPTH:
+        raise RuntimeError("schedule queue full")
+    index = (scheduled_start + scheduled_count) % SCHEDULE_DEPTH
+    scheduled_functions[index] = function
+    scheduled_args[index] = arg
+    scheduled_count += 1
+
+
+def advance_us(us):
+    global now_us
+    end = now_us + us
+    while True:
+        due = [timer for timer in timers if timer.next_us <= end]
+        if not due:
+            break
+        timer = min(due, key=lambda t: t.next_us)
+        now_us = max(now_us, timer.next_us)
+        timer.next_us += timer.period * 1000
+        timer.callback(timer)
+        run_scheduled()
+    now_us = end
+
+
+def advance_ms(ms):
+    advance_us(ms * 1000)
+
+
+def run_scheduled():
+    global scheduled_start, scheduled_count
+    while scheduled_count:
+        function = scheduled_functions[scheduled_start]
+        arg = scheduled_args[scheduled_start]
+        scheduled_functions[scheduled_start] = None
+        scheduled_args[scheduled_start] = None
+        scheduled_start = (scheduled_start + 1) % SCHEDULE_DEPTH
+        scheduled_count -= 1
+        function(arg)
+
+
+def reset():
+    global now_us, scheduled_start, scheduled_count
+    now_us = 0
+    del timers[:]
+    for index in range(0, SCHEDULE_DEPTH):
+        scheduled_functions[index] = None
+        scheduled_args[index] = None
+    scheduled_start = 0
+    scheduled_count = 0
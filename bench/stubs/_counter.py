@@ -0,0 +1,15 @@
+# counts calls into the stubbed firmware modules
+
+call_counts = {}
+
+
+def count(name):
+    call_counts[name] = call_counts.get(name, 0) + 1
+
+
+def reset():
+    call_counts.clear()
+
+
+def total(prefix):
+    return sum(n for (name, n) in call_counts.items() if name.startswith(prefix))
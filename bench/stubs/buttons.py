@@ -0,0 +1,40 @@
+import _clock
+from _counter import count
+
+BTN_UP = 0
+BTN_DOWN = 1
+BTN_LEFT = 2
+BTN_RIGHT = 3
+BTN_A = 4
+BTN_B = 5
+BTN_START = 6
+BTN_SELECT = 7
+BTN_HOME = 8
+BTN_MENU = 9
+
+handlers = {}
+# when a list, every simulated event is appended to it as (time in us,
+# button, pressed)
+trace = None
+
+
+def attach(button, callback):
+    count('buttons.attach')
+    handlers[button] = callback
+
+
+def detach(button):
+    handlers.pop(button, None)
+
+
+def press(button):
+    # simulate the firmware delivering a button event
+    if trace is not None:
+        trace.append((_clock.now_us, button, True))
+    handlers[button](True)
+
+
+def release(button):
+    if trace is not None:
+        trace.append((_clock.now_us, button, False))
+    handlers[button](False)
@@ -0,0 +1,49 @@
+from _counter import count
+
+WHITE = 0xffffff
+BLACK = 0x000000
+
+WIDTH = 320
+HEIGHT = 240
+
+
+def width():
+    return WIDTH
+
+
+def height():
+    return HEIGHT
+
+
+def getTextWidth(text, font=None):
+    count('display.getTextWidth')
+    return 8 * len(text)
+
+
+def getTextHeight(text, font=None):
+    count('display.getTextHeight')
+    return 16
+
+
+def drawFill(colour):
+    count('display.drawFill')
+
+
+def drawRect(x, y, width, height, filled, colour):
+    count('display.drawRect')
+
+
+def drawLine(x0, y0, x1, y1, colour):
+    count('display.drawLine')
+
+
+def drawRaw(x, y, width, height, data):
+    count('display.drawRaw')
+
+
+def drawText(x, y, text, colour, font=None):
+    count('display.drawText')
+
+
+def flush(*region):
+    count('display.flush')
@@ -0,0 +1,26 @@
+import _clock
+from _counter import count
+
+
+class Timer:
+    def __init__(self, timer_id):
+        self.timer_id = timer_id
+        self.period = None
+        self.callback = None
+        self.next_us = 0
+
+    def init(self, period=1000, mode=None, callback=None):
+        count('machine.Timer.init')
+        self.deinit()
+        self.period = period
+        self.callback = callback
+        self.next_us = _clock.now_us + period * 1000
+        _clock.timers.append(self)
+
+    def deinit(self):
+        if self in _clock.timers:
+            _clock.timers.remove(self)
+
+
+Timer.PERIODIC = 1
+Timer.ONE_SHOT = 0
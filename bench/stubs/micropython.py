@@ -0,0 +1,9 @@
+import _clock
+
+
+def schedule(function, arg):
+    _clock.schedule(function, arg)
+
+
+def const(value):
+    return value
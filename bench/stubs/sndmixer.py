@@ -0,0 +1,56 @@
+import _clock
+from _counter import count
+
+voice_count = 0
+# when a list, every call is appended to it as (time in us, name, *args)
+trace = None
+
+
+def reset():
+    global voice_count
+    voice_count = 0
+
+
+def begin(channels):
+    count('sndmixer.begin')
+    if trace is not None:
+        trace.append((_clock.now_us, 'begin', channels))
+
+
+def synth():
+    global voice_count
+    count('sndmixer.synth')
+    voice_count += 1
+    if trace is not None:
+        trace.append((_clock.now_us, 'synth'))
+    return voice_count
+
+
+def play(voice):
+    count('sndmixer.play')
+    if trace is not None:
+        trace.append((_clock.now_us, 'play', voice))
+
+
+def pause(voice):
+    count('sndmixer.pause')
+    if trace is not None:
+        trace.append((_clock.now_us, 'pause', voice))
+
+
+def waveform(voice, waveform):
+    count('sndmixer.waveform')
+    if trace is not None:
+        trace.append((_clock.now_us, 'waveform', voice, waveform))
+
+
+def freq(voice, freq):
+    count('sndmixer.freq')
+    if trace is not None:
+        trace.append((_clock.now_us, 'freq', voice, freq))
+
+
+def volume(voice, volume):
+    count('sndmixer.volume')
+    if trace is not None:
+        trace.append((_clock.now_us, 'volume', voice, volume))
@@ -0,0 +1,5 @@
+from _counter import count
+
+
+def launcher():
+    count('system.launcher')
@@ -0,0 +1,21 @@
+import _clock
+
+# Just enough of uasyncio to run runtime.Runtime against the virtual clock:
+# sleeping advances the clock (firing any timers and scheduled callbacks due)
+# instead of waiting, so nothing ever needs to be suspended.
+
+
+async def sleep_ms(ms):
+    _clock.advance_ms(ms)
+
+
+async def sleep(seconds):
+    _clock.advance_us(int(seconds * 1000000))
+
+
+def run(coro):
+    try:
+        while True:
+            coro.send(None)
+    except StopIteration as e:
+        return e.value
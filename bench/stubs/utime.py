@@ -0,0 +1,25 @@
+import _clock
+
+
+def ticks_us():
+    return _clock.now_us
+
+
+def ticks_ms():
+    return _clock.now_us // 1000
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def ticks_add(a, b):
+    return a + b
+
+
+def sleep_ms(ms):
+    _clock.advance_ms(ms)
+
+
+def sleep_us(us):
+    _clock.advance_us(us)
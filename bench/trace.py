@@ -0,0 +1,228 @@
+"""
+Record and replay traces of button events and the sndmixer calls they lead
+to, as regression tests for the player.
+
+    python bench/trace.py [NAME ...]
+    python bench/trace.py --record [NAME ...]
+
+--record runs the scripted scenarios below against the current code and
+writes what happened to bench/traces/NAME.trace. Otherwise, the button events
+of each stored trace are replayed at the same virtual times, and the sndmixer
+calls made are compared with the stored ones, printing a diff and exiting
+with status 1 if any differ. Re-record a trace only when a change to the sound is
+intended.
+
+A trace file is text, one event per line:
+
+    duration_us US
+    input US BUTTON 0|1     button event fed to the app
+    call US NAME ARG ...    call into sndmixer
+"""
+import argparse
+import difflib
+import os
+import random
+import sys
+import time
+
+import harness
+
+import _clock
+import buttons
+import sndmixer
+
+TRACES_DIR = os.path.join(harness.BENCH_DIR, 'traces')
+
+BUTTON_NAMES = {
+    getattr(buttons, name): name[len('BTN_'):]
+    for name in dir(buttons) if name.startswith('BTN_')
+}
+BUTTONS_BY_NAME = {name: button for (button, name) in BUTTON_NAMES.items()}
+
+
+def hold(button):
+    buttons.press(button)
+    harness.run_scheduled()
+
+
+def let_go(button):
+    buttons.release(button)
+    harness.run_scheduled()
+
+
+def scenario_play():
+    harness.press(buttons.BTN_START)
+    harness.advance_ms(4000)
+    harness.press(buttons.BTN_START)
+    harness.advance_ms(500)
+
+
+def scenario_tempo():
+    # change the tempo while playing, from the tempo input
+    harness.press(buttons.BTN_START)
+    harness.advance_ms(1000)
+    harness.press(buttons.BTN_RIGHT)
+    hold(buttons.BTN_A)
+    for _ in range(0, 3):
+        harness.press(buttons.BTN_UP)
+        harness.advance_ms(700)
+    harness.press(buttons.BTN_DOWN, hold_ms=1000)
+    let_go(buttons.BTN_A)
+    harness.advance_ms(1500)
+    harness.press(buttons.BTN_START)
+    harness.advance_ms(500)
+
+
+def scenario_edit():
+    # toggle cells and make bulk edits to the pattern while it plays
+    harness.press(buttons.BTN_START)
+    harness.press(buttons.BTN_DOWN)
+    harness.advance_ms(500)
+    harness.press(buttons.BTN_A)
+    harness.press(buttons.BTN_RIGHT, hold_ms=900)
+    harness.press(buttons.BTN_A)
+    harness.press(buttons.BTN_DOWN)
+    harness.advance_ms(1000)
+    hold(buttons.BTN_B)
+    harness.press(buttons.BTN_UP)
+    harness.advance_ms(1000)
+    harness.press(buttons.BTN_RIGHT)
+    harness.advance_ms(500)
+    harness.press(buttons.BTN_START)
+    harness.advance_ms(1000)
+    let_go(buttons.BTN_B)
+    harness.press(buttons.BTN_START)
+    harness.advance_ms(500)
+
+
+SCENARIOS = {
+    'play': scenario_play,
+    'tempo': scenario_tempo,
+    'edit': scenario_edit,
+}
+
+
+def start():
+    app = harness.load_app()
+    # full collections are slow on CPython, and make no difference to the
+    # sound
+    app.player.gc_control = False
+    # pattern randomising is part of the traces
+    random.seed(0)
+    sndmixer.trace = []
+    buttons.trace = []
+    return app
+
+
+def finish():
+    calls = sndmixer.trace
+    inputs = buttons.trace
+    sndmixer.trace = None
+    buttons.trace = None
+    return inputs, calls
+
+
+def record(scenario):
+    start()
+    scenario()
+    duration_us = _clock.now_us
+    inputs, calls = finish()
+    return duration_us, inputs, calls
+
+
+def replay(duration_us, inputs):
+    # returns the sndmixer calls made, and the wall time taken in ns (not
+    # counting loading the app)
+    start()
+    start_ns = time.perf_counter_ns()
+    for time_us, button, pressed in inputs:
+        _clock.advance_us(time_us - _clock.now_us)
+        if pressed:
+            buttons.press(button)
+        else:
+            buttons.release(button)
+        _clock.run_scheduled()
+    _clock.advance_us(duration_us - _clock.now_us)
+    elapsed_ns = time.perf_counter_ns() - start_ns
+    return finish()[1], elapsed_ns
+
+
+def format_call(call):
+    return "call %d %s" % (call[0], " ".join(str(arg) for arg in call[1:]))
+
+
+def write_trace(path, duration_us, inputs, calls):
+    with open(path, 'w') as f:
+        f.write("duration_us %d\n" % duration_us)
+        for time_us, button, pressed in inputs:
+            f.write("input %d %s %d\n" % (time_us, BUTTON_NAMES[button], pressed))
+        for call in calls:
+            f.write(format_call(call) + "\n")
+
+
+def read_trace(path):
+    duration_us = 0
+    inputs = []
+    calls = []
+    with open(path) as f:
+        for line in f:
+            kind, time_us, *fields = line.split()
+            if kind == 'duration_us':
+                duration_us = int(time_us)
+            elif kind == 'input':
+                inputs.append((int(time_us), BUTTONS_BY_NAME[fields[0]], fields[1] == '1'))
+            elif kind == 'call':
+                calls.append((int(time_us), fields[0]) + tuple(int(arg) for arg in fields[1:]))
+    return duration_us, inputs, calls
+
+
+def check(name):
+    duration_us, inputs, expected = read_trace(os.path.join(TRACES_DIR, name + '.trace'))
+    calls, elapsed_ns = replay(duration_us, inputs)
+    elapsed_ms = elapsed_ns / 1000000
+
+    ticks = duration_us // 20000
+    print("%-8s %6d calls, %5d ticks in %6.1fms (%.0f ticks / ms)  %s" % (
+        name, len(calls), ticks, elapsed_ms, ticks / elapsed_ms,
+        "ok" if calls == expected else "DIFFERENT",
+    ))
+    if calls == expected:
+        return True
+
+    diff = difflib.unified_diff(
+        [format_call(call) for call in expected], [format_call(call) for call in calls],
+        'expected', 'replayed', lineterm='', n=2,
+    )
+    for index, line in enumerate(diff):
+        if index == 40:
+            print("    ...")
+            break
+        print("    " + line)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or check boogiebadge traces")
+    parser.add_argument('--record', action='store_true', help="re-record the scenarios")
+    parser.add_argument('names', nargs='*')
+    args = parser.parse_args()
+
+    if args.record:
+        os.makedirs(TRACES_DIR, exist_ok=True)
+        for name in args.names or sorted(SCENARIOS):
+            duration_us, inputs, calls = record(SCENARIOS[name])
+            write_trace(os.path.join(TRACES_DIR, name + '.trace'), duration_us, inputs, calls)
+            print("%-8s %d inputs, %d calls recorded" % (name, len(inputs), len(calls)))
+        return
+
+    names = args.names or sorted(
+        filename[:-len('.trace')] for filename in os.listdir(TRACES_DIR)
+        if filename.endswith('.trace')
+    )
+    results = [check(name) for name in names]
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
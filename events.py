@@ -0,0 +1,51 @@
+from array import array
+
+
+class EventQueue:
+    # fixed-size ring buffer of (event, argument) pairs, used to hand events from
+    # timer and button callbacks over to the UI without allocating
+    def __init__(self, size=16):
+        self.size = size
+        self.events = bytearray(size)
+        self.args = array('h', [0] * size)
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+
+    def post(self, event, arg=0, reserve=0):
+        # reserve keeps that many slots free for other, more important events
+        if self.count >= self.size - reserve:
+            self.dropped += 1
+            return False
+        index = (self.head + self.count) % self.size
+        self.events[index] = event
+        self.args[index] = arg
+        self.count += 1
+        return True
+
+    def post_or_merge(self, event, arg):
+        # add arg to the argument of the last event posted if it is the same
+        # event, or post it as a new one otherwise
+        if self.count:
+            index = (self.head + self.count - 1) % self.size
+            if self.events[index] == event:
+                self.args[index] += arg
+                return True
+        return self.post(event, arg)
+
+    def post_or_replace(self, event, arg, reserve=0):
+        # replace the argument of the last event posted if it is the same
+        # event, or post it as a new one otherwise
+        if self.count:
+            index = (self.head + self.count - 1) % self.size
+            if self.events[index] == event:
+                self.args[index] = arg
+                return True
+        return self.post(event, arg, reserve)
+
+    def pop(self):
+        event = self.events[self.head]
+        arg = self.args[self.head]
+        self.head = (self.head + 1) % self.size
+        self.count -= 1
+        return event, arg
@@ -0,0 +1,132 @@
+import gc
+import os
+
+from . import trackfile
+from .storage import DEFAULT_DIRECTORY, SNAPSHOT_EXTENSION, Storage
+from .track import CompiledTrack
+
+
+class LibraryEntry:
+    # what the library list shows for a track, read from its file header
+    __slots__ = ('name', 'tempo', 'sample_count', 'pattern_count', 'size')
+
+    def __init__(self, name, tempo, sample_count, pattern_count, size):
+        self.name = name
+        self.tempo = tempo
+        self.sample_count = sample_count
+        self.pattern_count = pattern_count
+        self.size = size
+
+
+class OpenTrack:
+    # a track loaded from the library, with its compiled notes and storage;
+    # view is for the app to keep the track's view in
+    __slots__ = ('name', 'track', 'compiled', 'storage', 'view')
+
+    def __init__(self, name, track, compiled, storage):
+        self.name = name
+        self.track = track
+        self.compiled = compiled
+        self.storage = storage
+        self.view = None
+
+
+class TrackLibrary:
+    # Lists the tracks saved in a directory by reading just their headers,
+    # and loads a track only when it is opened. The most recently opened
+    # tracks stay in memory so that switching back to one is instant; the
+    # least recently used are dropped once more than max_cached are open, or
+    # when free memory falls below min_free bytes. The most recent one is
+    # never dropped.
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_cached=4, min_free=32 * 1024):
+        self.directory = directory
+        self.max_cached = max_cached
+        self.min_free = min_free
+        self.entries = []
+        # least recently used first
+        self.cache = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def scan(self):
+        entries = []
+        try:
+            filenames = sorted(os.listdir(self.directory))
+        except OSError:
+            filenames = []
+
+        for filename in filenames:
+            if not filename.endswith(SNAPSHOT_EXTENSION):
+                continue
+            try:
+                with open(self.directory + '/' + filename, 'rb') as f:
+                    header = trackfile.read_header(f)
+            except (OSError, ValueError):
+                continue
+            tempo, sample_count, pattern_count, bytes_size, frequencies_size = header
+            entries.append(LibraryEntry(
+                filename[:-len(SNAPSHOT_EXTENSION)], tempo, sample_count, pattern_count,
+                trackfile.HEADER_SIZE + bytes_size + frequencies_size,
+            ))
+
+        # tracks that are open but have not been saved as a snapshot yet
+        for item in self.cache:
+            if not any(entry.name == item.name for entry in entries):
+                entries.append(LibraryEntry(
+                    item.name, item.track.tempo, len(item.track.samples),
+                    len(item.track.patterns), 0,
+                ))
+
+        self.entries = entries
+        return entries
+
+    def is_cached(self, name):
+        return self.find(name) is not None
+
+    def find(self, name):
+        for item in self.cache:
+            if item.name == name:
+                return item
+        return None
+
+    def add(self, name, track, storage, compiled=None):
+        # put an already loaded track in the cache, as the most recent
+        if compiled is None:
+            compiled = CompiledTrack(track)
+        item = OpenTrack(name, track, compiled, storage)
+        self.cache.append(item)
+        self.evict()
+        return item
+
+    def open(self, name, make_default_track=None):
+        item = self.find(name)
+        if item is not None:
+            self.hits += 1
+            self.cache.remove(item)
+            self.cache.append(item)
+            return item
+
+        self.misses += 1
+        # make room before loading rather than after
+        self.evict()
+        storage = Storage(self.directory, name)
+        track = storage.load(make_default_track)
+        if track is None:
+            return None
+        return self.add(name, track, storage)
+
+    def mem_free(self):
+        return gc.mem_free()
+
+    def evict(self):
+        while len(self.cache) > 1 and (
+            len(self.cache) > self.max_cached or self.mem_free() < self.min_free
+        ):
+            item = self.cache.pop(0)
+            if not item.storage.has_snapshot:
+                # without a snapshot there would be nothing to load it from
+                item.storage.compact(item.track)
+            item.storage.close()
+            self.evictions += 1
+            gc.collect()
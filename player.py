@@ -1,174 +1,686 @@
+from array import array
+import gc
+
+import micropython
 import sndmixer
+import utime
+
+from .events import EventQueue
+from .timers import IdleTimer
+from .track import EFFECT_NONE, EFFECT_RETRIGGER, NO_PITCH, TONES, CompiledTrack, EffectState
 
 CHANNEL_COUNT = 4
 ROW_COUNT = 16
 
+TICK_US = 20000
+TICKS_PER_SECOND = 1000000 // TICK_US
 
-# A-4 = 440Hz
-# if C-0 has note value 0, note value = (octave * 12) + note
-# C  C# D  D# E  F  F# G  G# A  A# B
-# 0  1  2  3  4  5  6  7  8  9  10 11
-# A4 = 48 + 9 = 57
-# freq = 440 * 2**((n-57)/12)
-
-TONES = [
-    round(440 * 2**((n - 57) / 12))
-    for n in range(0, 107)
-]
-
-
-class Sample:
-    def __init__(self, waveform, volumes, frequencies):
-        self.waveform = waveform
-        self.volumes = volumes
-        self.frequencies = frequencies
-
-    def to_json(self):
-        return {
-            'waveform': self.waveform,
-            'volumes': self.volumes,
-            'frequencies': self.frequencies,
-        }
-
-    @classmethod
-    def from_json(cls, data):
-        return cls(
-            waveform=data['waveform'],
-            volumes=data['volumes'],
-            frequencies=data['frequencies'],
-        )
-
-
-class Pattern:
-    def __init__(self, rows, default_sample, default_pitch, label=""):
-        self.rows = rows
-        self.default_sample = default_sample
-        self.default_pitch = default_pitch
-        self.label = label
-
-    def to_json(self):
-        return {
-            'rows': [list(row) for row in self.rows],
-            'default_sample': self.default_sample,
-            'default_pitch': self.default_pitch,
-            'label': self.label,
-        }
-
-    @classmethod
-    def from_json(cls, data):
-        return cls(
-            rows=[tuple(row) for row in data['rows']],
-            default_sample=data['default_sample'],
-            default_pitch=data['default_pitch'],
-            label=data.get('label', ""),
-        )
-
-
-class Track:
-    def __init__(self, samples, patterns, tempo):
-        self.samples = samples
-        self.patterns = patterns
-        self.tempo = tempo
-
-    def to_json(self):
-        return {
-            'samples': {
-                str(i): sample.to_json() for (i, sample) in self.samples.items()
-            },
-            'patterns': [
-                pattern.to_json()
-                for pattern in self.patterns
-            ],
-            'tempo': self.tempo
-        }
-
-    @classmethod
-    def from_json(cls, data):
-        return cls(
-            samples={
-                int(i): Sample.from_json(sample) for (i, sample) in data['samples'].items()
-            },
-            patterns=[
-                Pattern.from_json(pattern)
-                for pattern in data['patterns']
-            ],
-            tempo=data['tempo']
-        )
-
-
-class Channel:
-    def __init__(self, index):
-        self.index = index
-        self.track = None
-        self.id = sndmixer.synth()
-        self.current_sample = None
-        self.current_pitch = None
-        self.sample_tick = 0
+EVENT_ROW = 0
+EVENT_START = 1
+EVENT_STOP = 2
 
-    def start(self):
+# slots of the event queue that row events can't use, so that a stop and a
+# start always get through
+RESERVED_EVENTS = 2
+
+
+class AllocationMonitor:
+    # Instrumentation hook for Player.tick: records the number of bytes of heap
+    # allocated by each tick, and the duration of the garbage collections the
+    # player runs between rows. Install with player.monitor = AllocationMonitor()
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.tick_count = 0
+        self.allocating_tick_count = 0
+        self.allocated_bytes = 0
+        self.max_tick_bytes = 0
+        self.gc_count = 0
+        self.gc_total_us = 0
+        self.max_gc_us = 0
+        self._tick_start = 0
+
+    def allocated(self):
+        return gc.mem_alloc()
+
+    def begin_tick(self):
+        self._tick_start = self.allocated()
+
+    def end_tick(self, row_start=False):
+        allocated = self.allocated() - self._tick_start
+        self.tick_count += 1
+        if allocated > 0:
+            self.allocating_tick_count += 1
+            self.allocated_bytes += allocated
+            if allocated > self.max_tick_bytes:
+                self.max_tick_bytes = allocated
+
+    def on_gc(self, duration_us):
+        self.gc_count += 1
+        self.gc_total_us += duration_us
+        if duration_us > self.max_gc_us:
+            self.max_gc_us = duration_us
+
+
+class TickStats:
+    # Monitor for Player.tick, like AllocationMonitor, recording how long each
+    # tick takes: a histogram of tick durations in bucket_us wide buckets (the
+    # last bucket collects everything longer), plus the average and worst case
+    # for ticks that start a row and for all ticks
+    def __init__(self, bucket_us=100, bucket_count=20):
+        self.bucket_us = bucket_us
+        self.histogram = array('L', [0] * bucket_count)
+        self.reset()
+
+    def reset(self):
+        for index in range(0, len(self.histogram)):
+            self.histogram[index] = 0
+        self.tick_count = 0
+        self.total_us = 0
+        self.max_us = 0
+        self.row_start_count = 0
+        self.row_start_total_us = 0
+        self.row_start_max_us = 0
+        self._tick_start = 0
+
+    def now_us(self):
+        return utime.ticks_us()
+
+    def begin_tick(self):
+        self._tick_start = self.now_us()
+
+    def end_tick(self, row_start=False):
+        duration = utime.ticks_diff(self.now_us(), self._tick_start)
+        bucket = duration // self.bucket_us
+        if bucket >= len(self.histogram):
+            bucket = len(self.histogram) - 1
+        self.histogram[bucket] += 1
+
+        self.tick_count += 1
+        self.total_us += duration
+        if duration > self.max_us:
+            self.max_us = duration
+        if row_start:
+            self.row_start_count += 1
+            self.row_start_total_us += duration
+            if duration > self.row_start_max_us:
+                self.row_start_max_us = duration
+
+    def on_gc(self, duration_us):
+        pass
+
+    def average_us(self):
+        return self.total_us // self.tick_count if self.tick_count else 0
+
+    def row_start_average_us(self):
+        return self.row_start_total_us // self.row_start_count if self.row_start_count else 0
+
+
+class Scheduler:
+    # Drives Player.tick from a periodic timer. Rather than assuming that each
+    # timer callback is one tick, it works out from the microsecond clock how
+    # many ticks are due, so that late or missed callbacks are caught up on
+    # (up to max_catch_up ticks in one go) instead of slowing the groove down.
+    # Also keeps statistics on timer lateness and jitter.
+    #
+    # The timer only runs while the player is playing or auditioning.
+    def __init__(self, player, timer_id=1, max_catch_up=4):
+        self.player = player
+        player.scheduler = self
+        self.max_catch_up = max_catch_up
+        self.run_callback = self.run
+        self.timer = IdleTimer(timer_id, TICK_US // 1000, self.run_callback)
+        self.was_playing = False
+        self.next_tick_us = 0
+        self.last_run_us = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.tick_count = 0
+        # ticks run late enough that another tick was already due
+        self.caught_up_count = 0
+        # ticks given up on because the player fell too far behind
+        self.dropped_count = 0
+        self.total_lateness_us = 0
+        self.max_lateness_us = 0
+        # deviation of the time between timer callbacks from TICK_US
+        self.total_jitter_us = 0
+        self.max_jitter_us = 0
+        self.run_count = 0
+
+    def restart(self):
+        # forget the previous timeline, so that the first run after the timer
+        # has been off isn't taken as late, and doesn't count as jitter
+        self.was_playing = False
+        self.next_tick_us = 0
+        self.last_run_us = None
+
+    def arm(self):
+        if self.timer is not None and not self.timer.is_armed:
+            self.restart()
+            self.timer.arm()
+
+    def disarm(self):
+        if self.timer is not None and self.timer.is_armed:
+            self.timer.disarm()
+            self.restart()
+
+    def detach_timer(self):
+        # stop using the hardware timer; run must then be called every TICK_US
+        # by something else
+        self.disarm()
+        self.timer = None
+
+    def run(self, _=None):
+        now = utime.ticks_us()
+        if self.last_run_us is not None:
+            jitter = abs(utime.ticks_diff(now, self.last_run_us) - TICK_US)
+            self.total_jitter_us += jitter
+            if jitter > self.max_jitter_us:
+                self.max_jitter_us = jitter
+        self.last_run_us = now
+        self.run_count += 1
+
+        if not self.player.is_active():
+            self.was_playing = False
+            return
+        if not self.was_playing:
+            # playback has just started, and its first tick is due now
+            self.next_tick_us = now
+            self.was_playing = True
+
+        ticks_run = 0
+        # a callback that arrives slightly early still counts for the tick due
+        while utime.ticks_diff(now, self.next_tick_us) > -TICK_US // 2:
+            if ticks_run == self.max_catch_up:
+                # too far behind to catch up; start again from now
+                missed = utime.ticks_diff(now, self.next_tick_us) // TICK_US + 1
+                self.dropped_count += missed
+                self.next_tick_us = utime.ticks_add(now, TICK_US)
+                break
+
+            lateness = max(0, utime.ticks_diff(now, self.next_tick_us))
+            self.total_lateness_us += lateness
+            if lateness > self.max_lateness_us:
+                self.max_lateness_us = lateness
+            if ticks_run > 0:
+                self.caught_up_count += 1
+
+            self.player.tick()
+            self.tick_count += 1
+            ticks_run += 1
+            self.next_tick_us = utime.ticks_add(self.next_tick_us, TICK_US)
+
+    def average_lateness_us(self):
+        return self.total_lateness_us // self.tick_count if self.tick_count else 0
+
+    def average_jitter_us(self):
+        return self.total_jitter_us // (self.run_count - 1) if self.run_count > 1 else 0
+
+
+class Voice:
+    # wraps a sndmixer synth voice, remembering the last value written to each
+    # register so that writes which would not change anything can be skipped
+    def __init__(self):
+        self.id = sndmixer.synth()
+        self.waveform = None
+        self.freq = None
+        self.volume = None
+        self.skipped_writes = 0
+        # the channel currently playing through this voice, and when it was
+        # allocated to it
+        self.owner = None
+        self.allocated_at = 0
+
+    def play(self):
         sndmixer.play(self.id)
 
-    def stop(self):
+    def pause(self):
         sndmixer.pause(self.id)
 
-    def load_row(self, row_index):
-        pitch, sample_number = self.track.patterns[self.index].rows[row_index]
-        if pitch is None:
+    def set_waveform(self, waveform):
+        if waveform == self.waveform:
+            self.skipped_writes += 1
+        else:
+            sndmixer.waveform(self.id, waveform)
+            self.waveform = waveform
+
+    def set_freq(self, freq):
+        if freq == self.freq:
+            self.skipped_writes += 1
+        else:
+            sndmixer.freq(self.id, freq)
+            self.freq = freq
+
+    def set_volume(self, volume):
+        if volume == self.volume:
+            self.skipped_writes += 1
+        else:
+            sndmixer.volume(self.id, volume)
+            self.volume = volume
+
+
+class VoicePool:
+    # Shares a fixed set of voices between any number of channels. A channel
+    # is given a voice when it starts a note and gives it back as soon as the
+    # note's envelope has reached silence; when every voice is busy, the
+    # quietest one is taken away from its channel, or the oldest of those that
+    # are equally quiet.
+    def __init__(self, voices):
+        self.voices = voices
+        self.allocation_count = 0
+        self.steal_count = 0
+
+    def allocate(self, channel):
+        self.allocation_count += 1
+        chosen = None
+        chosen_volume = 0
+        for voice in self.voices:
+            if voice.owner is None:
+                chosen = voice
+                break
+            # a voice allocated on this row hasn't been written to yet, and
+            # counts as silent
+            volume = 0 if voice.volume is None else voice.volume
+            if chosen is None or volume < chosen_volume or (
+                volume == chosen_volume and voice.allocated_at < chosen.allocated_at
+            ):
+                chosen = voice
+                chosen_volume = volume
+
+        if chosen.owner is not None:
+            self.steal_count += 1
+            chosen.owner.voice = None
+        chosen.owner = channel
+        chosen.allocated_at = self.allocation_count
+        channel.voice = chosen
+
+    def release(self, voice):
+        voice.owner.voice = None
+        voice.owner = None
+
+    def release_all(self):
+        for voice in self.voices:
+            if voice.owner is not None:
+                voice.set_volume(0)
+                self.release(voice)
+
+    def busy_count(self):
+        return sum(1 for voice in self.voices if voice.owner is not None)
+
+
+class Channel(EffectState):
+    # plays one lane of the song, working through the patterns of its chain
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+        self.track = None
+        self.compiled = None
+        self.pool = None
+        self.voice = None
+        self.chain = None
+        self.chain_position = 0
+        self.pattern = None
+        self.pattern_length = 0
+        self.next_pattern = None
+        self.row_index = 0
+        self.current_sample_number = 0
+        self.current_note = None
+        self.sample_tick = 0
+        # the upcoming row, decoded ahead of time by decode_next_row
+        self.is_decoded = False
+        self.decoded_trigger = False
+        self.decoded_sample_number = 0
+        self.decoded_note = None
+        self.decoded_tone = 0
+        self.decoded_effect = EFFECT_NONE
+        self.decoded_effect_param = 0
+
+    def load_track(self, track, compiled):
+        self.track = track
+        self.compiled = compiled
+        self.chain = track.chains[self.index]
+        self.rewind()
+
+    def rewind(self):
+        self.chain_position = 0
+        self.pattern = self.track.patterns[self.chain[0]]
+        self.pattern_length = len(self.pattern)
+        self.next_pattern = self._pattern_after(0)
+        self.row_index = 0
+        self.is_decoded = False
+
+    def _pattern_after(self, chain_position):
+        chain_position += 1
+        if chain_position >= len(self.chain):
+            chain_position = 0
+        return self.track.patterns[self.chain[chain_position]]
+
+    def decode_row(self, pattern, row_index):
+        self.is_decoded = True
+        self.decoded_effect = pattern.effects[row_index]
+        self.decoded_effect_param = pattern.effect_params[row_index]
+        pitch = pattern.pitches[row_index]
+        if pitch == NO_PITCH:
+            self.decoded_trigger = False
             return
 
+        self.decoded_trigger = True
+        self.decoded_tone = TONES[pitch]
+        sample_number = pattern.sample_numbers[row_index]
+        if sample_number == 0:
+            sample_number = self.current_sample_number
+        self.decoded_sample_number = sample_number
+        if sample_number == 0:
+            self.decoded_note = None
+        else:
+            self.decoded_note = self.compiled.get_note(pitch, sample_number)
+
+    def decode_next_row(self):
+        # decode the row after the current one, so that starting it only needs
+        # to copy the result across
+        row_index = self.row_index + 1
+        pattern = self.pattern
+        if row_index >= self.pattern_length:
+            row_index = 0
+            pattern = self.next_pattern
+        self.decode_row(pattern, row_index)
+
+    def load_row(self):
+        if not self.is_decoded:
+            self.decode_row(self.pattern, self.row_index)
+        self.is_decoded = False
+        self.start_effect(self.decoded_effect, self.decoded_effect_param)
+        if not self.decoded_trigger:
+            return
+
+        self.sample_tick = 0
+        self.current_sample_number = self.decoded_sample_number
+        if self.decoded_note is not None:
+            self.start_note(self.decoded_tone, self.current_note is not None)
+            self.current_note = self.decoded_note
+            if self.voice is None:
+                self.pool.allocate(self)
+
+    def trigger(self, note):
+        # start playing a note straight away, outside of the song (see
+        # Player.audition)
+        self.start_effect(EFFECT_NONE, 0)
+        self.start_note(note.tone, False)
         self.sample_tick = 0
-        self.current_pitch = pitch
-        if sample_number != 0:
-            self.current_sample = self.track.samples[sample_number]
+        self.current_note = note
+        if self.voice is None:
+            self.pool.allocate(self)
+
+    def next_row(self):
+        self.row_index += 1
+        if self.row_index >= self.pattern_length:
+            self.row_index = 0
+            self.chain_position += 1
+            if self.chain_position >= len(self.chain):
+                self.chain_position = 0
+            self.pattern = self.next_pattern
+            self.pattern_length = len(self.pattern)
+            # find the pattern after this one now, so that the next pattern
+            # boundary costs no more than any other row
+            self.next_pattern = self._pattern_after(self.chain_position)
 
     def play_tick(self):
-        if self.current_sample is None or self.sample_tick >= 32:
-            sndmixer.volume(self.id, 0)
+        if self.effect == EFFECT_RETRIGGER and self.is_retrigger_due():
+            self.sample_tick = 0
+            if self.voice is None and self.current_note is not None:
+                self.pool.allocate(self)
+
+        note = self.current_note
+        voice = self.voice
+        if voice is None:
+            pass
+        elif note is None or self.sample_tick >= note.length:
+            voice.set_volume(0)
+            self.pool.release(voice)
         else:
-            sndmixer.waveform(self.id, self.current_sample.waveform)
-            freq = max(0, TONES[self.current_pitch] + self.current_sample.frequencies[self.sample_tick])
-            sndmixer.freq(self.id, freq)
-            sndmixer.volume(self.id, self.current_sample.volumes[self.sample_tick])
+            sample_tick = self.sample_tick
+            freq = note.frequencies[sample_tick]
+            volume = note.volumes[sample_tick]
+            if self.effect != EFFECT_NONE or self.bend or self.volume_offset:
+                freq = self.apply_effect(freq)
+                volume = self.apply_volume(volume)
+            voice.set_waveform(note.waveform)
+            voice.set_freq(freq)
+            voice.set_volume(volume)
 
         self.sample_tick += 1
+        self.effect_tick += 1
 
 
 class Player:
-    def __init__(self):
-        sndmixer.begin(CHANNEL_COUNT)
-        self.channels = [Channel(i) for i in range(0, CHANNEL_COUNT)]
+    def __init__(self, voice_count=CHANNEL_COUNT):
+        self.voice_count = voice_count
+        self.voices = ()
+        self.pool = None
+        self.channels = ()
+        self.has_audio = False
+        self.track = None
+        self.song_length = 0
+        # Row timing: every tick adds row_step to row_phase, and a row ends
+        # whenever row_phase reaches row_period. These are integers so that
+        # fractional tempos don't drift.
+        self.tempo = None
+        self.bpm = None
+        self.row_step = 1
+        self.row_period = 1
+        self.row_phase = 0
+        self.ticks_per_row = 1
         self.is_started = False
         self.is_playing = False
+        # a note being played on its own by audition, on a channel of its own
+        self.is_auditioning = False
+        self.audition_channel = Channel(-1)
+        self.compiled = None
         self.row_callbacks = []
         self.stop_callbacks = []
         self.start_callbacks = []
-
-    def load_track(self, track):
+        self.events = EventQueue()
+        self.pump_scheduled = False
+        self._pump_events = self.pump_events
+        # when false, pump_events is not scheduled automatically, and must be
+        # called by whatever runs the UI (see runtime.Runtime)
+        self.auto_pump = True
+
+        # While playing, the automatic garbage collector is disabled so that it
+        # can never run in the middle of a tick; instead, every
+        # gc_interval_rows rows the tick asks for a collection, which
+        # pump_events runs after the tick has returned
+        self.gc_control = True
+        self.gc_interval_rows = ROW_COUNT
+        self.rows_since_gc = 0
+        self.gc_pending = False
+        self.monitor = None
+        self.lookahead = True
+        # set by Scheduler, which is armed and disarmed as playback starts and
+        # stops
+        self.scheduler = None
+
+    def load_track(self, track, compiled=None):
+        # compiled may be a CompiledTrack kept from an earlier load_track
         self.track = track
+        self.compiled = CompiledTrack(track) if compiled is None else compiled
+        self.song_length = track.song_length()
+        if self.has_audio:
+            self.pool.release_all()
+        # one channel per lane; they share the voices in the pool
+        self.channels = tuple(Channel(i) for i in range(0, len(track.chains)))
         for chan in self.channels:
-            chan.track = track
+            chan.load_track(track, self.compiled)
+            chan.pool = self.pool
+
+    def pattern_changed(self, pattern_index):
+        # call after editing a pattern of the loaded track: forgets any row of
+        # it decoded ahead of time, so that an edit to the next row is heard
+        pattern = self.track.patterns[pattern_index]
+        for chan in self.channels:
+            if chan.pattern is pattern or chan.next_pattern is pattern:
+                chan.is_decoded = False
+
+    def update_tempo(self):
+        track = self.track
+        self.tempo = track.tempo
+        self.bpm = track.bpm
+        if track.bpm is None:
+            self.row_step = 1
+            self.row_period = track.tempo
+        else:
+            # rows per tick = bpm * rows_per_beat / (60 * TICKS_PER_SECOND),
+            # with bpm counted in hundredths
+            self.row_step = round(track.bpm * 100) * track.rows_per_beat
+            self.row_period = 60 * TICKS_PER_SECOND * 100
+        self.ticks_per_row = max(1, self.row_period // self.row_step)
+        # a tempo change takes effect straight away; if the current row has
+        # already run past its new length, end it on this tick
+        if self.row_phase + self.row_step > self.row_period:
+            self.row_phase = max(0, self.row_period - self.row_step)
+
+    def init_audio(self):
+        # the mixer is set up on first use rather than at startup
+        sndmixer.begin(self.voice_count)
+        self.voices = tuple(Voice() for _ in range(0, self.voice_count))
+        self.pool = VoicePool(self.voices)
+        self.audition_channel.pool = self.pool
+        for chan in self.channels:
+            chan.pool = self.pool
+        self.has_audio = True
 
     def start(self):
+        if self.track is None:
+            return
+
         self.row_tick = 0
+        self.row_phase = 0
         self.row_index = 0
+        self.update_tempo()
+        for chan in self.channels:
+            chan.rewind()
+
+        if not self.has_audio:
+            self.init_audio()
+        self.pool.release_all()
 
         if not self.is_started:
-            for chan in self.channels:
-                chan.start()
+            for voice in self.voices:
+                voice.play()
             self.is_started = True
 
         self.is_playing = True
-        for callback in self.start_callbacks:
-            callback()
+        if self.gc_control:
+            gc.collect()
+            gc.disable()
+            self.rows_since_gc = 0
+        if self.scheduler is not None:
+            self.scheduler.arm()
+        self.post_event(EVENT_START)
 
     def stop(self):
-        for chan in self.channels:
-            chan.stop()
+        if self.is_started:
+            for voice in self.voices:
+                voice.pause()
         self.is_started = False
         self.is_playing = False
-
-        for callback in self.stop_callbacks:
-            callback()
+        self.is_auditioning = False
+        if self.scheduler is not None:
+            self.scheduler.disarm()
+        if self.gc_control:
+            gc.enable()
+        self.post_event(EVENT_STOP)
+
+    def audition(self, pitch, sample_number):
+        # play one note of a sample, over the song if it is playing; edits to
+        # the sample made with CompiledTrack.invalidate_sample are heard as it
+        # plays
+        if self.track is None or sample_number not in self.track.samples:
+            return
+        if not self.has_audio:
+            self.init_audio()
+        if not self.is_started:
+            for voice in self.voices:
+                voice.play()
+            self.is_started = True
+        self.audition_channel.trigger(self.compiled.get_note(pitch, sample_number))
+        self.is_auditioning = True
+        if self.scheduler is not None:
+            self.scheduler.arm()
+
+    def audition_tick(self):
+        chan = self.audition_channel
+        chan.play_tick()
+        if chan.voice is None:
+            # the note has finished, or its voice was taken by the song
+            self.is_auditioning = False
+            if not self.is_playing:
+                for voice in self.voices:
+                    voice.pause()
+                self.is_started = False
+                if self.scheduler is not None:
+                    self.scheduler.disarm()
+
+    def is_active(self):
+        # whether the player needs ticks
+        return self.is_playing or self.is_auditioning
+
+    def skipped_writes(self):
+        return sum(voice.skipped_writes for voice in self.voices)
+
+    def post_event(self, event, arg=0):
+        # queue an event for the row / start / stop callbacks, which are run
+        # later by pump_events so that drawing never happens inside a tick.
+        # Only the latest of a run of rows is drawn, so a row replaces a row
+        # that hasn't been handled yet.
+        if event == EVENT_ROW:
+            posted = self.events.post_or_replace(event, arg, RESERVED_EVENTS)
+        else:
+            posted = self.events.post(event, arg)
+        if posted:
+            self.schedule_pump()
+
+    def schedule_pump(self):
+        if self.auto_pump and not self.pump_scheduled:
+            try:
+                micropython.schedule(self._pump_events, None)
+                self.pump_scheduled = True
+            except RuntimeError:
+                # schedule queue is full; the next event will try again
+                pass
+
+    def pump_events(self, _=None):
+        self.pump_scheduled = False
+        pending_row = None
+        while self.events.count:
+            event, arg = self.events.pop()
+            if event == EVENT_ROW:
+                pending_row = arg
+                continue
+
+            if pending_row is not None:
+                self._dispatch_row(pending_row)
+                pending_row = None
+
+            if event == EVENT_START:
+                callbacks = self.start_callbacks
+            else:
+                callbacks = self.stop_callbacks
+            for callback in callbacks:
+                callback()
+
+        if pending_row is not None:
+            self._dispatch_row(pending_row)
+
+        if self.gc_pending:
+            self.gc_pending = False
+            self.collect_garbage()
+
+    def _dispatch_row(self, row_index):
+        for callback in self.row_callbacks:
+            callback(row_index)
 
     def on_play_row(self, callback):
         self.row_callbacks.append(callback)
@@ -179,21 +691,79 @@ class Player:
     def on_stop(self, callback):
         self.stop_callbacks.append(callback)
 
+    def remove_callback(self, callback):
+        for callbacks in (self.row_callbacks, self.start_callbacks, self.stop_callbacks):
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def collect_garbage(self):
+        start = utime.ticks_us()
+        gc.collect()
+        if self.monitor is not None:
+            self.monitor.on_gc(utime.ticks_diff(utime.ticks_us(), start))
+
     def tick(self):
+        # this runs in the audio timer and must not allocate
+        if self.is_auditioning:
+            self.audition_tick()
         if not self.is_playing:
             return
 
-        if self.row_tick == 0:
-            for chan in self.channels:
-                chan.load_row(self.row_index)
+        monitor = self.monitor
+        if monitor is not None:
+            monitor.begin_tick()
 
-            for callback in self.row_callbacks:
-                callback(self.row_index)
+        track = self.track
+        if track.tempo != self.tempo or track.bpm != self.bpm:
+            self.update_tempo()
 
-        for chan in self.channels:
+        channels = self.channels
+        row_tick = self.row_tick
+        if row_tick == 0:
+            for chan in channels:
+                chan.load_row()
+
+            self.post_event(EVENT_ROW, self.row_index)
+
+        for chan in channels:
             chan.play_tick()
 
+        if self.lookahead:
+            # decode the next row during the ticks of this one that don't start
+            # a row, a few channels at a time, rather than all at once when it
+            # starts; load_row decodes anything that is missed
+            ticks_per_row = self.ticks_per_row
+            if ticks_per_row == 1:
+                for chan in channels:
+                    chan.decode_next_row()
+            elif row_tick > 0:
+                # a while loop, as a range with a variable step allocates
+                index = row_tick - 1
+                step = ticks_per_row - 1
+                count = len(channels)
+                while index < count:
+                    channels[index].decode_next_row()
+                    index += step
+
         self.row_tick += 1
-        if self.row_tick >= self.track.tempo:
+        self.row_phase += self.row_step
+        if self.row_phase >= self.row_period:
+            self.row_phase -= self.row_period
             self.row_tick = 0
-            self.row_index = (self.row_index + 1) % 16
+            for chan in self.channels:
+                chan.next_row()
+            # row_index counts rows of the whole song, for the UI
+            self.row_index += 1
+            if self.row_index >= self.song_length:
+                self.row_index = 0
+            self.rows_since_gc += 1
+
+        if monitor is not None:
+            monitor.end_tick(row_tick == 0)
+
+        # collect between rows, once this row's registers have been written,
+        # but outside of the tick
+        if self.gc_control and self.row_tick == 0 and self.rows_since_gc >= self.gc_interval_rows:
+            self.rows_since_gc = 0
+            self.gc_pending = True
+            self.schedule_pump()
@@ -0,0 +1,155 @@
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+import utime
+
+from .player import TICK_US
+from .ui import REPEAT_MS
+
+if hasattr(asyncio, 'sleep_ms'):
+    sleep_ms = asyncio.sleep_ms
+else:
+    def sleep_ms(ms):
+        return asyncio.sleep(ms / 1000)
+
+PRIORITY_AUDIO = 3
+PRIORITY_INPUT = 2
+PRIORITY_UI = 1
+
+UI_PERIOD_MS = 20
+
+
+class Task:
+    # a callback run every period_ms; it has missed its deadline if it starts
+    # more than deadline_ms after it was due
+    def __init__(self, name, callback, period_ms, priority, deadline_ms=None):
+        self.name = name
+        self.callback = callback
+        self.period_ms = period_ms
+        self.priority = priority
+        self.deadline_ms = period_ms if deadline_ms is None else deadline_ms
+        self.next_ms = utime.ticks_ms()
+        self.busy_us = 0
+        self.run_count = 0
+        self.missed_deadlines = 0
+        self.max_lateness_ms = 0
+
+
+class Runtime:
+    # Runs periodic tasks one at a time on a single uasyncio loop, so that
+    # none of them can interrupt another in the middle of drawing or of a
+    # tick. When several tasks are due, the one with the highest priority runs
+    # first, and the loop yields to the scheduler between tasks.
+    def __init__(self):
+        self.tasks = []
+        self.running = False
+        self.started_us = utime.ticks_us()
+
+    def add_task(self, name, callback, period_ms, priority, deadline_ms=None):
+        task = Task(name, callback, period_ms, priority, deadline_ms)
+        self.tasks.append(task)
+        self.tasks.sort(key=lambda task: task.priority, reverse=True)
+        return task
+
+    def run_next_task(self, now):
+        # run the highest priority task that is due; returns False if none is
+        for task in self.tasks:
+            lateness = utime.ticks_diff(now, task.next_ms)
+            if lateness < 0:
+                continue
+
+            if lateness > task.deadline_ms:
+                task.missed_deadlines += 1
+            if lateness > task.max_lateness_ms:
+                task.max_lateness_ms = lateness
+
+            start = utime.ticks_us()
+            task.callback()
+            task.busy_us += utime.ticks_diff(utime.ticks_us(), start)
+            task.run_count += 1
+
+            task.next_ms = utime.ticks_add(task.next_ms, task.period_ms)
+            if utime.ticks_diff(now, task.next_ms) >= 0:
+                # a whole period behind; skip the missed runs
+                task.next_ms = utime.ticks_add(now, task.period_ms)
+            return True
+        return False
+
+    def ms_until_next_task(self, now):
+        wait = None
+        for task in self.tasks:
+            until = utime.ticks_diff(task.next_ms, now)
+            if wait is None or until < wait:
+                wait = until
+        return max(0, wait)
+
+    async def run(self, duration_ms=None):
+        # run until stop is called, or for duration_ms
+        self.running = True
+        start = utime.ticks_ms()
+        while self.running:
+            now = utime.ticks_ms()
+            if duration_ms is not None:
+                remaining = duration_ms - utime.ticks_diff(now, start)
+                if remaining <= 0:
+                    break
+
+            if self.run_next_task(now):
+                await sleep_ms(0)
+                continue
+
+            wait = self.ms_until_next_task(now)
+            if duration_ms is not None and remaining < wait:
+                wait = remaining
+            await sleep_ms(wait)
+        self.running = False
+
+    def start(self):
+        # run the loop forever; does not return
+        asyncio.run(self.run())
+
+    def stop(self):
+        self.running = False
+
+    def reset_stats(self):
+        self.started_us = utime.ticks_us()
+        for task in self.tasks:
+            task.busy_us = 0
+            task.run_count = 0
+            task.missed_deadlines = 0
+            task.max_lateness_ms = 0
+
+    def cpu_shares(self):
+        # list of (task name, percentage of time spent in it) since the last
+        # reset_stats, with the remaining time as 'idle'
+        elapsed_us = max(1, utime.ticks_diff(utime.ticks_us(), self.started_us))
+        shares = []
+        idle = 100
+        for task in self.tasks:
+            share = task.busy_us * 100 / elapsed_us
+            shares.append((task.name, share))
+            idle -= share
+        shares.append(('idle', max(0, idle)))
+        return shares
+
+
+def create_runtime(player, scheduler, controller):
+    # move the audio ticks, joystick repeat and drawing over from the timer
+    # and button callbacks onto one Runtime
+    scheduler.detach_timer()
+    controller.set_deferred()
+    player.auto_pump = False
+
+    def redraw():
+        player.pump_events()
+        # handles queued button presses, then flushes everything drawn
+        controller.process_events()
+
+    runtime = Runtime()
+    runtime.add_task(
+        'audio', scheduler.run, TICK_US // 1000, PRIORITY_AUDIO, deadline_ms=TICK_US // 2000
+    )
+    runtime.add_task('input', controller.repeat_tick, REPEAT_MS, PRIORITY_INPUT)
+    runtime.add_task('ui', redraw, UI_PERIOD_MS, PRIORITY_UI)
+    return runtime
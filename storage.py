@@ -0,0 +1,214 @@
+# Saving tracks to flash as a snapshot plus an append-only journal of edits.
+#
+# Each track is stored under a name in a directory, as NAME.bbt and NAME.jnl.
+# The snapshot is a binary track file (see trackfile). Each edit made since
+# the snapshot was written is appended to the journal as one fixed-size
+# record, so that saving an edit only writes a few bytes:
+#
+#   record      RECORD_FORMAT: kind, a 16-bit field, two byte-sized fields, a
+#               signed 16-bit value, and a check byte
+#
+#   RECORD_CELL         pattern, row, sample number; value is the pitch
+#                       (NO_PITCH to clear the row)
+#   RECORD_WAVEFORM     sample number; value is the waveform
+#   RECORD_VOLUME       sample number, envelope step; value is the volume
+#   RECORD_FREQUENCY    sample number, envelope step; value is the offset
+#   RECORD_TEMPO        value is the tempo
+#   RECORD_EFFECT       pattern, row, effect; value is the effect parameter
+#
+# Every record sets a value outright, so replaying a journal over a snapshot
+# that already includes some of its edits gives the same track. That makes
+# compaction (writing a new snapshot and then deleting the journal) safe to
+# interrupt at any point. A record cut short by a crash fails its check and
+# ends the replay.
+
+import os
+import struct
+
+from . import trackfile
+from .track import NO_PITCH
+
+DEFAULT_DIRECTORY = '/flash/boogiebadge'
+SNAPSHOT_EXTENSION = '.bbt'
+JOURNAL_EXTENSION = '.jnl'
+
+RECORD_FORMAT = '<BHBBhB'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+RECORD_CELL = 1
+RECORD_WAVEFORM = 2
+RECORD_VOLUME = 3
+RECORD_FREQUENCY = 4
+RECORD_TEMPO = 5
+RECORD_EFFECT = 6
+
+# number of records buffered in memory between writes to the journal
+BUFFER_RECORDS = 64
+
+
+def _check_byte(kind, a, b, c, value):
+    return (kind + a + (a >> 8) + b + c + value + 0x5a) & 0xff
+
+
+class Storage:
+    # Failing to write (e.g. with no /flash, as on the host) is not fatal:
+    # the track stays in memory and write_errors counts the failures
+    def __init__(self, directory=DEFAULT_DIRECTORY, name='track', compact_after=256):
+        self.directory = directory
+        self.name = name
+        self.snapshot_path = directory + '/' + name + SNAPSHOT_EXTENSION
+        self.journal_path = directory + '/' + name + JOURNAL_EXTENSION
+        # compaction is due once the journal holds this many records
+        self.compact_after = compact_after
+        self.buffer = bytearray(BUFFER_RECORDS * RECORD_SIZE)
+        self.buffered = 0
+        self.journal = None
+        self.journal_records = 0
+        self.write_errors = 0
+        self.replayed_records = 0
+        # whether the track has been saved as a snapshot, rather than only
+        # as edits to a default track
+        self.has_snapshot = False
+
+    def load(self, make_default_track=None):
+        # the saved track with the journal replayed over it or, if there is no
+        # snapshot, the track returned by make_default_track (also with the
+        # journal replayed); make_default_track is only called then
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                track = trackfile.load(f)
+            self.has_snapshot = True
+        except OSError:
+            track = None if make_default_track is None else make_default_track()
+        if track is None:
+            return None
+
+        try:
+            with open(self.journal_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            data = b''
+        self.replayed_records = self.replay(track, data)
+        self.journal_records = self.replayed_records
+        if self.replayed_records * RECORD_SIZE < len(data):
+            # the journal ends in a damaged record, after which new records
+            # would never be replayed
+            self.compact(track)
+        return track
+
+    def replay(self, track, data):
+        # apply the records in data to track; returns the number applied
+        count = 0
+        for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+            kind, a, b, c, value, check = struct.unpack_from(RECORD_FORMAT, data, offset)
+            if check != _check_byte(kind, a, b, c, value):
+                break
+            try:
+                self.apply(track, kind, a, b, c, value)
+            except (IndexError, KeyError):
+                # an edit to something the snapshot doesn't have
+                pass
+            count += 1
+        return count
+
+    def apply(self, track, kind, a, b, c, value):
+        if kind == RECORD_CELL:
+            track.patterns[a].set_row(b, None if value == NO_PITCH else value, c)
+        elif kind == RECORD_WAVEFORM:
+            track.samples[a].waveform = value
+        elif kind == RECORD_VOLUME:
+            track.samples[a].volumes[b] = value
+        elif kind == RECORD_FREQUENCY:
+            track.samples[a].frequencies[b] = value
+        elif kind == RECORD_TEMPO:
+            track.tempo = value
+        elif kind == RECORD_EFFECT:
+            track.patterns[a].set_effect(b, c, value)
+
+    def record(self, kind, a=0, b=0, c=0, value=0):
+        if self.buffered == BUFFER_RECORDS:
+            self.flush()
+        struct.pack_into(
+            RECORD_FORMAT, self.buffer, self.buffered * RECORD_SIZE,
+            kind, a, b, c, value, _check_byte(kind, a, b, c, value)
+        )
+        self.buffered += 1
+
+    def record_cell(self, pattern_index, row_index, pattern):
+        self.record(
+            RECORD_CELL, pattern_index, row_index, pattern.sample_numbers[row_index],
+            pattern.pitches[row_index],
+        )
+
+    def record_effect(self, pattern_index, row_index, pattern):
+        self.record(
+            RECORD_EFFECT, pattern_index, row_index, pattern.effects[row_index],
+            pattern.effect_params[row_index],
+        )
+
+    def record_waveform(self, sample_number, waveform):
+        self.record(RECORD_WAVEFORM, sample_number, value=waveform)
+
+    def record_volume(self, sample_number, step, volume):
+        self.record(RECORD_VOLUME, sample_number, step, value=volume)
+
+    def record_frequency(self, sample_number, step, frequency):
+        self.record(RECORD_FREQUENCY, sample_number, step, value=frequency)
+
+    def record_tempo(self, tempo):
+        self.record(RECORD_TEMPO, value=tempo)
+
+    def _make_directory(self):
+        try:
+            os.mkdir(self.directory)
+        except OSError:
+            # already exists, or can't be made, in which case opening fails
+            pass
+
+    def flush(self):
+        # append the buffered records to the journal
+        if not self.buffered:
+            return
+        size = self.buffered * RECORD_SIZE
+        self.buffered = 0
+        try:
+            if self.journal is None:
+                self._make_directory()
+                self.journal = open(self.journal_path, 'ab')
+            self.journal.write(memoryview(self.buffer)[:size])
+            self.journal.flush()
+        except OSError:
+            self.write_errors += 1
+            return
+        self.journal_records += size // RECORD_SIZE
+
+    def close(self):
+        self.flush()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def needs_compaction(self):
+        return self.journal_records >= self.compact_after
+
+    def compact(self, track):
+        # write the whole track as a new snapshot and start a new journal
+        self.close()
+        temporary_path = self.snapshot_path + '.tmp'
+        try:
+            self._make_directory()
+            with open(temporary_path, 'wb') as f:
+                trackfile.dump(track.to_json(), f)
+            os.rename(temporary_path, self.snapshot_path)
+        except OSError:
+            self.write_errors += 1
+            return False
+
+        try:
+            os.remove(self.journal_path)
+        except OSError:
+            # no journal yet
+            pass
+        self.journal_records = 0
+        self.has_snapshot = True
+        return True
@@ -0,0 +1,34 @@
+import machine
+import utime
+
+
+class IdleTimer:
+    # A periodic machine.Timer that is only armed while there is work for it
+    # to do, keeping count of the callbacks that were avoided while it wasn't
+    def __init__(self, timer_id, period, callback):
+        self.timer = machine.Timer(timer_id)
+        self.period = period
+        self.callback = callback
+        self.is_armed = False
+        self.idle_since = utime.ticks_ms()
+        self.avoided_wakeups = 0
+
+    def arm(self):
+        if self.is_armed:
+            return
+        self.avoided_wakeups += utime.ticks_diff(utime.ticks_ms(), self.idle_since) // self.period
+        self.timer.init(period=self.period, callback=self.callback)
+        self.is_armed = True
+
+    def disarm(self):
+        if not self.is_armed:
+            return
+        self.timer.deinit()
+        self.is_armed = False
+        self.idle_since = utime.ticks_ms()
+
+    def wakeups_avoided(self):
+        if self.is_armed:
+            return self.avoided_wakeups
+        # include the wakeups avoided so far in the current idle spell
+        return self.avoided_wakeups + utime.ticks_diff(utime.ticks_ms(), self.idle_since) // self.period
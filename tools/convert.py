@@ -0,0 +1,33 @@
+"""
+Convert tracks between the JSON and binary formats.
+
+    python tools/convert.py input.json output.bbt
+    python tools/convert.py input.bbt output.json
+
+The output format is chosen by the file extension of the output file.
+"""
+import argparse
+import json
+
+from render import import_package_module, load_track
+
+trackfile = import_package_module('trackfile')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert boogiebadge track files")
+    parser.add_argument('input', help="track file, in JSON or binary format")
+    parser.add_argument('output', help="file to write; .json for JSON, anything else for binary")
+    args = parser.parse_args()
+
+    data = load_track(args.input).to_json()
+    if args.output.endswith('.json'):
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=4)
+    else:
+        with open(args.output, 'wb') as f:
+            trackfile.dump(data, f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Render a track to a WAV file on the host, without a badge attached.
+
+    python tools/render.py track.json|track.bbt out.wav [--loops N] [--rate HZ]
+
+This mirrors the envelope and effect logic of Player.tick / Channel.play_tick to
+work out the synth registers for every 20ms tick, then generates the audio for
+all ticks of a channel in one vectorised NumPy pass.
+"""
+import argparse
+import json
+import os
+import sys
+import types
+import wave
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_package_module(name):
+    # import a hardware-independent module of the app (e.g. 'track') without
+    # running the package __init__, which needs the badge firmware modules
+    if 'boogiebadge' not in sys.modules:
+        package = types.ModuleType('boogiebadge')
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules['boogiebadge'] = package
+    return __import__('boogiebadge.' + name, fromlist=[name])
+
+
+track_module = import_package_module('track')
+trackfile = import_package_module('trackfile')
+
+TICK_MS = 20
+MAX_VOLUME = 255
+NOISE_TABLE_SIZE = 4096
+
+
+def load_track(path):
+    # load a track from either a JSON or a binary track file
+    with open(path, 'rb') as f:
+        is_binary = f.read(len(trackfile.MAGIC)) == trackfile.MAGIC
+        f.seek(0)
+        if is_binary:
+            return trackfile.load(f)
+        return track_module.Track.from_json(json.load(f))
+
+
+def chain_rows(track, chain):
+    # yields (pattern, row_index) for the rows of one lane, looping forever
+    while True:
+        for pattern_index in chain:
+            pattern = track.patterns[pattern_index]
+            for row_index in range(0, len(pattern)):
+                yield pattern, row_index
+
+
+def row_starts(track, row_count):
+    # list of booleans, one per tick, true for the ticks that start a row;
+    # the same fixed-point row timing as Player.update_tempo / Player.tick
+    if track.bpm is None:
+        step, period = 1, track.tempo
+    else:
+        step, period = round(track.bpm * 100) * track.rows_per_beat, 60 * 50 * 100
+    starts = []
+    phase = 0
+    rows = 0
+    while rows < row_count:
+        starts.append(phase < step)
+        if phase < step:
+            rows += 1
+        phase += step
+        if phase >= period:
+            phase -= period
+    # let the last row play out
+    while phase >= step:
+        starts.append(False)
+        phase += step
+        if phase >= period:
+            phase -= period
+    return starts
+
+
+def render_registers(track, loops=1):
+    # return (waveforms, freqs, volumes) arrays of shape (channels, ticks),
+    # holding the register values the player would write on each tick
+    compiled = track_module.CompiledTrack(track)
+    channel_count = len(track.chains)
+    starts = row_starts(track, track.song_length() * loops)
+    tick_count = len(starts)
+    waveforms = np.zeros((channel_count, tick_count), dtype=np.int8)
+    freqs = np.zeros((channel_count, tick_count), dtype=np.int32)
+    volumes = np.zeros((channel_count, tick_count), dtype=np.int32)
+
+    for index, chain in enumerate(track.chains):
+        rows = chain_rows(track, chain)
+        sample_number = 0
+        note = None
+        sample_tick = 0
+        waveform = 0
+        freq = 0
+        # the same effect state and maths as Channel
+        state = track_module.EffectState()
+        for tick in range(0, tick_count):
+            if starts[tick]:
+                pattern, row_index = next(rows)
+                pitch, row_sample_number = pattern.get_row(row_index)
+                state.start_effect(*pattern.get_effect(row_index))
+                if pitch is not None:
+                    sample_tick = 0
+                    if row_sample_number != 0:
+                        sample_number = row_sample_number
+                    if sample_number != 0:
+                        state.start_note(track_module.TONES[pitch], note is not None)
+                        note = compiled.get_note(pitch, sample_number)
+
+            if state.is_retrigger_due():
+                sample_tick = 0
+
+            # registers keep their last value while the channel is silent
+            if note is not None and sample_tick < note.length:
+                waveform = note.waveform
+                freq = state.apply_effect(note.frequencies[sample_tick])
+                volumes[index, tick] = state.apply_volume(note.volumes[sample_tick])
+            waveforms[index, tick] = waveform
+            freqs[index, tick] = freq
+            sample_tick += 1
+            state.effect_tick += 1
+
+    return waveforms, freqs, volumes
+
+
+def synthesise(waveforms, freqs, volumes, sample_rate, seed=0):
+    # turn per-tick register values into a float mix in the range -1..1
+    samples_per_tick = sample_rate * TICK_MS // 1000
+    channel_count = waveforms.shape[0]
+    noise = np.random.default_rng(seed).uniform(-1, 1, NOISE_TABLE_SIZE)
+    mix = np.zeros(waveforms.shape[1] * samples_per_tick)
+
+    for index in range(0, channel_count):
+        # phase advance per sample, integrated across the whole channel so
+        # that it stays continuous over tick boundaries
+        step = np.repeat(freqs[index] / sample_rate, samples_per_tick)
+        cycles = np.cumsum(step) - step
+        phase = cycles % 1.0
+        waveform = np.repeat(waveforms[index], samples_per_tick)
+        gain = np.repeat(volumes[index] / MAX_VOLUME, samples_per_tick)
+
+        out = np.empty_like(phase)
+        mask = waveform == track_module.WAVEFORM_SINE
+        out[mask] = np.sin(2 * np.pi * phase[mask])
+        mask = waveform == track_module.WAVEFORM_SQUARE
+        out[mask] = np.where(phase[mask] < 0.5, 1.0, -1.0)
+        mask = waveform == track_module.WAVEFORM_TRIANGLE
+        out[mask] = 4 * np.abs(phase[mask] - 0.5) - 1
+        mask = waveform == track_module.WAVEFORM_SAWTOOTH
+        out[mask] = 2 * phase[mask] - 1
+        mask = waveform == track_module.WAVEFORM_NOISE
+        # a new random level every half cycle
+        out[mask] = noise[(cycles[mask] * 2).astype(np.int64) % NOISE_TABLE_SIZE]
+
+        mix += out * gain
+
+    return mix / channel_count
+
+
+def render_track(track, sample_rate=22050, loops=1):
+    return synthesise(*render_registers(track, loops=loops), sample_rate=sample_rate)
+
+
+def write_wav(path, mix, sample_rate, normalise=True):
+    if normalise:
+        peak = np.max(np.abs(mix))
+        if peak > 0:
+            mix = mix / peak
+    pcm = (np.clip(mix, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a boogiebadge track to WAV")
+    parser.add_argument('track', help="track file, in JSON or binary format")
+    parser.add_argument('output', help="WAV file to write")
+    parser.add_argument('--loops', type=int, default=1)
+    parser.add_argument('--rate', type=int, default=22050)
+    parser.add_argument('--no-normalise', dest='normalise', action='store_false')
+    args = parser.parse_args()
+
+    track = load_track(args.track)
+    mix = render_track(track, sample_rate=args.rate, loops=args.loops)
+    write_wav(args.output, mix, args.rate, normalise=args.normalise)
+
+
+if __name__ == '__main__':
+    main()
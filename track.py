@@ -0,0 +1,438 @@
+from array import array
+import random
+
+WAVEFORM_SINE = 0
+WAVEFORM_SQUARE = 1
+WAVEFORM_TRIANGLE = 2
+WAVEFORM_SAWTOOTH = 3
+WAVEFORM_NOISE = 4
+
+# A-4 = 440Hz
+# if C-0 has note value 0, note value = (octave * 12) + note
+# C  C# D  D# E  F  F# G  G# A  A# B
+# 0  1  2  3  4  5  6  7  8  9  10 11
+# A4 = 48 + 9 = 57
+# freq = 440 * 2**((n-57)/12), rounded to the nearest Hz for n in 0..106
+
+TONES = [
+    16, 17, 18, 19, 21, 22, 23, 24, 26, 28, 29, 31,
+    33, 35, 37, 39, 41, 44, 46, 49, 52, 55, 58, 62,
+    65, 69, 73, 78, 82, 87, 92, 98, 104, 110, 117, 123,
+    131, 139, 147, 156, 165, 175, 185, 196, 208, 220, 233, 247,
+    262, 277, 294, 311, 330, 349, 370, 392, 415, 440, 466, 494,
+    523, 554, 587, 622, 659, 698, 740, 784, 831, 880, 932, 988,
+    1047, 1109, 1175, 1245, 1319, 1397, 1480, 1568, 1661, 1760, 1865, 1976,
+    2093, 2217, 2349, 2489, 2637, 2794, 2960, 3136, 3322, 3520, 3729, 3951,
+    4186, 4435, 4699, 4978, 5274, 5588, 5920, 6272, 6645, 7040, 7459,
+]
+
+
+ENVELOPE_LENGTH = 32
+
+# stands in for a pitch of None in a pattern's pitches buffer
+NO_PITCH = 0xff
+
+# Effect commands, which apply on every tick of the row they are on. The
+# parameter is a byte, written here as xy for its two 4-bit halves.
+EFFECT_NONE = 0
+# cycle between the note and the notes x and y semitones above it each tick
+EFFECT_ARPEGGIO = 1
+# bend the pitch up / down by xy sixteenths of a Hz per tick; the bend stays
+# until the next note
+EFFECT_SLIDE_UP = 2
+EFFECT_SLIDE_DOWN = 3
+# start from the pitch of the previous note and slide to this row's by xy
+# sixteenths of a Hz per tick
+EFFECT_PORTAMENTO = 4
+# wobble the pitch x 64ths of a cycle per tick, up to y 16ths of a semitone
+EFFECT_VIBRATO = 5
+# raise the volume by x and lower it by y per tick, until the next note; the
+# note still ends where its envelope does
+EFFECT_VOLUME_SLIDE = 6
+# restart the note every y ticks
+EFFECT_RETRIGGER = 7
+
+# 4096 * 2 ** (n / 12), the frequency ratio of n semitones in 12-bit fixed point
+SEMITONE_RATIOS = [
+    4096, 4340, 4598, 4871, 5161, 5468, 5793, 6137,
+    6502, 6889, 7298, 7732, 8192, 8679, 9195, 9742,
+]
+
+# one cycle of a sine wave, in 64 steps from -127 to 127
+VIBRATO_WAVE = array('b', [
+    0, 12, 25, 37, 49, 60, 71, 81, 90, 98, 106, 112, 117, 122, 125, 126,
+    127, 126, 125, 122, 117, 112, 106, 98, 90, 81, 71, 60, 49, 37, 25, 12,
+    0, -12, -25, -37, -49, -60, -71, -81, -90, -98, -106, -112, -117, -122, -125, -126,
+    -127, -126, -125, -122, -117, -112, -106, -98, -90, -81, -71, -60, -49, -37, -25, -12,
+])
+
+
+class EffectState:
+    # The effect a channel is playing and the accumulators it builds up, with
+    # the per-tick integer maths that applies it. Player.Channel builds on
+    # this, and tools/render.py uses it directly, so the two play effects the
+    # same way. The pitch bend is in sixteenths of a Hz and the volume offset
+    # in volume steps; both last until the next note.
+    def __init__(self):
+        self.effect = EFFECT_NONE
+        self.effect_param = 0
+        self.effect_tick = 0
+        self.current_tone = 0
+        self.bend = 0
+        self.volume_offset = 0
+        self.vibrato_phase = 0
+
+    def start_effect(self, effect, param):
+        # called at the start of every row
+        self.effect = effect
+        self.effect_param = param
+        self.effect_tick = 0
+
+    def start_note(self, tone, is_legato):
+        # is_legato is true when a previous note was playing on the channel
+        if self.effect == EFFECT_PORTAMENTO and is_legato:
+            # start from wherever the previous note's pitch had got to
+            self.bend += (self.current_tone - tone) << 4
+        else:
+            self.bend = 0
+        self.volume_offset = 0
+        self.vibrato_phase = 0
+        self.current_tone = tone
+
+    def is_retrigger_due(self):
+        if self.effect != EFFECT_RETRIGGER:
+            return False
+        interval = self.effect_param & 0xf
+        return interval != 0 and self.effect_tick != 0 and self.effect_tick % interval == 0
+
+    def apply_effect(self, freq):
+        # update the effect's accumulators for this tick, and return freq
+        # with any effect on the pitch applied
+        effect = self.effect
+        param = self.effect_param
+        if effect == EFFECT_ARPEGGIO:
+            step = self.effect_tick % 3
+            if step == 1:
+                freq = freq * SEMITONE_RATIOS[param >> 4] >> 12
+            elif step == 2:
+                freq = freq * SEMITONE_RATIOS[param & 0xf] >> 12
+        elif effect == EFFECT_SLIDE_UP:
+            self.bend += param
+        elif effect == EFFECT_SLIDE_DOWN:
+            self.bend -= param
+        elif effect == EFFECT_PORTAMENTO:
+            if self.bend > param:
+                self.bend -= param
+            elif self.bend < -param:
+                self.bend += param
+            else:
+                self.bend = 0
+        elif effect == EFFECT_VIBRATO:
+            self.vibrato_phase = (self.vibrato_phase + (param >> 4)) & 63
+            freq = freq * (4096 + (VIBRATO_WAVE[self.vibrato_phase] * (param & 0xf) >> 3)) >> 12
+        elif effect == EFFECT_VOLUME_SLIDE:
+            self.volume_offset += (param >> 4) - (param & 0xf)
+        if self.bend:
+            freq = max(0, freq + (self.bend >> 4))
+        return freq
+
+    def apply_volume(self, volume):
+        # call after apply_effect, which updates the volume offset
+        if self.volume_offset:
+            return min(255, max(0, volume + self.volume_offset))
+        return volume
+
+
+class Sample:
+    __slots__ = ('waveform', 'volumes', 'frequencies')
+
+    def __init__(self, waveform, volumes, frequencies):
+        self.waveform = waveform
+        # bytearray (or a memoryview over one) of ENVELOPE_LENGTH volumes
+        self.volumes = volumes
+        # array('h') (or a memoryview over one) of frequency offsets
+        self.frequencies = frequencies
+
+    def to_json(self):
+        return {
+            'waveform': self.waveform,
+            'volumes': list(self.volumes),
+            'frequencies': list(self.frequencies),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            waveform=data['waveform'],
+            volumes=bytearray(data['volumes']),
+            frequencies=array('h', data['frequencies']),
+        )
+
+
+class Pattern:
+    # Rows are stored as parallel byte buffers, so that reading and editing
+    # them never allocates: pitches (NO_PITCH for an empty row), sample
+    # numbers (0 to keep playing the previous sample), and effect commands
+    # (EFFECT_*) with their parameters
+    __slots__ = (
+        'pitches', 'sample_numbers', 'effects', 'effect_params', 'default_sample',
+        'default_pitch', 'label',
+    )
+
+    def __init__(
+        self, pitches, sample_numbers, default_sample, default_pitch, label="",
+        effects=None, effect_params=None
+    ):
+        self.pitches = pitches
+        self.sample_numbers = sample_numbers
+        self.effects = bytearray(len(pitches)) if effects is None else effects
+        self.effect_params = bytearray(len(pitches)) if effect_params is None else effect_params
+        self.default_sample = default_sample
+        self.default_pitch = default_pitch
+        self.label = label
+
+    def __len__(self):
+        return len(self.pitches)
+
+    def get_row(self, index):
+        pitch = self.pitches[index]
+        if pitch == NO_PITCH:
+            pitch = None
+        return pitch, self.sample_numbers[index]
+
+    def set_row(self, index, pitch, sample_number):
+        self.pitches[index] = NO_PITCH if pitch is None else pitch
+        self.sample_numbers[index] = sample_number
+
+    def clear_row(self, index):
+        self.pitches[index] = NO_PITCH
+        self.sample_numbers[index] = 0
+        self.effects[index] = EFFECT_NONE
+        self.effect_params[index] = 0
+
+    def get_effect(self, index):
+        return self.effects[index], self.effect_params[index]
+
+    def set_effect(self, index, effect, param):
+        self.effects[index] = effect
+        self.effect_params[index] = param
+
+    def is_set(self, index):
+        return self.pitches[index] != NO_PITCH
+
+    def fill(self, step, offset, pitch, sample_number):
+        # set every step-th row, starting from offset
+        for index in range(offset % step, len(self.pitches), step):
+            self.set_row(index, pitch, sample_number)
+
+    def clear(self):
+        for index in range(0, len(self.pitches)):
+            self.clear_row(index)
+
+    def rotate(self, amount):
+        # move every row amount rows later (or earlier, if negative), wrapping
+        # around at the end; done in place by reversing three times
+        length = len(self.pitches)
+        amount %= length
+        if amount:
+            for buffer in (self.pitches, self.sample_numbers, self.effects, self.effect_params):
+                _reverse(buffer, 0, length)
+                _reverse(buffer, 0, amount)
+                _reverse(buffer, amount, length)
+
+    def randomise(self, chance, pitch, sample_number):
+        # set each row with a chance of chance percent, and clear it otherwise
+        threshold = chance * 256 // 100
+        for index in range(0, len(self.pitches)):
+            if random.getrandbits(8) < threshold:
+                self.set_row(index, pitch, sample_number)
+            else:
+                self.clear_row(index)
+
+    def copy(self):
+        return Pattern(
+            bytearray(self.pitches), bytearray(self.sample_numbers),
+            self.default_sample, self.default_pitch, self.label,
+            bytearray(self.effects), bytearray(self.effect_params),
+        )
+
+    def paste(self, other):
+        # replace the rows with those of other, repeating them if other is
+        # shorter; the defaults and label are kept
+        other_length = len(other)
+        for index in range(0, len(self.pitches)):
+            source = index % other_length
+            self.pitches[index] = other.pitches[source]
+            self.sample_numbers[index] = other.sample_numbers[source]
+            self.effects[index] = other.effects[source]
+            self.effect_params[index] = other.effect_params[source]
+
+    def row_to_json(self, index):
+        # [pitch, sample number], followed by [effect, parameter] if the row
+        # has an effect
+        row = list(self.get_row(index))
+        if self.effects[index] != EFFECT_NONE:
+            row.extend(self.get_effect(index))
+        return row
+
+    def to_json(self):
+        return {
+            'rows': [self.row_to_json(index) for index in range(0, len(self.pitches))],
+            'default_sample': self.default_sample,
+            'default_pitch': self.default_pitch,
+            'label': self.label,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        rows = data['rows']
+        return cls(
+            pitches=bytearray([NO_PITCH if row[0] is None else row[0] for row in rows]),
+            sample_numbers=bytearray([row[1] for row in rows]),
+            default_sample=data['default_sample'],
+            default_pitch=data['default_pitch'],
+            label=data.get('label', ""),
+            effects=bytearray([row[2] if len(row) > 2 else EFFECT_NONE for row in rows]),
+            effect_params=bytearray([row[3] if len(row) > 3 else 0 for row in rows]),
+        )
+
+
+def _reverse(buffer, start, end):
+    end -= 1
+    while start < end:
+        buffer[start], buffer[end] = buffer[end], buffer[start]
+        start += 1
+        end -= 1
+
+
+class Track:
+    # Each lane of the song plays a chain of patterns (given as an array('H')
+    # of indexes into patterns) one after another, and loops back to the start of the chain
+    # after the last one. By default lane n just loops pattern n.
+    #
+    # The speed is given either as tempo, a whole number of 20ms ticks per row,
+    # or (if not None) as bpm, in beats per minute of rows_per_beat rows, which
+    # may be fractional.
+    def __init__(self, samples, patterns, tempo, chains=None, bpm=None, rows_per_beat=4):
+        self.samples = samples
+        self.patterns = patterns
+        self.tempo = tempo
+        self.bpm = bpm
+        self.rows_per_beat = rows_per_beat
+        if chains is None:
+            chains = [array('H', [i]) for i in range(0, len(patterns))]
+        self.chains = chains
+
+    def chain_length(self, chain):
+        # number of rows in one pass through a chain
+        return sum(len(self.patterns[pattern_index]) for pattern_index in chain)
+
+    def song_length(self):
+        # number of rows in the song; lanes with a shorter chain loop early
+        return max(self.chain_length(chain) for chain in self.chains)
+
+    def to_json(self):
+        return {
+            'samples': {
+                str(i): sample.to_json() for (i, sample) in self.samples.items()
+            },
+            'patterns': [
+                pattern.to_json()
+                for pattern in self.patterns
+            ],
+            'chains': [list(chain) for chain in self.chains],
+            'tempo': self.tempo,
+            'bpm': self.bpm,
+            'rows_per_beat': self.rows_per_beat,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        chains = data.get('chains')
+        return cls(
+            samples={
+                int(i): Sample.from_json(sample) for (i, sample) in data['samples'].items()
+            },
+            patterns=[
+                Pattern.from_json(pattern)
+                for pattern in data['patterns']
+            ],
+            tempo=data['tempo'],
+            chains=None if chains is None else [array('H', chain) for chain in chains],
+            bpm=data.get('bpm'),
+            rows_per_beat=data.get('rows_per_beat', 4),
+        )
+
+
+class CompiledNote:
+    # frequency and volume envelopes for one (pitch, sample) pair, pre-rendered
+    # so that playback only needs to index into them
+    def __init__(self, sample, pitch):
+        self.tone = TONES[pitch]
+        self.waveform = sample.waveform
+        self.frequencies = array('H', [max(0, self.tone + f) for f in sample.frequencies])
+        self.volumes = bytearray(sample.volumes)
+        self.update_length()
+
+    def update_length(self):
+        # the note is silent from this step onwards
+        self.length = len(self.volumes)
+        while self.length > 0 and self.volumes[self.length - 1] == 0:
+            self.length -= 1
+
+    def update(self, sample):
+        # re-render from the sample in place, so that a channel that is
+        # already playing the note picks up the change
+        tone = self.tone
+        self.waveform = sample.waveform
+        frequencies = self.frequencies
+        volumes = self.volumes
+        for step in range(0, len(volumes)):
+            frequencies[step] = max(0, tone + sample.frequencies[step])
+            volumes[step] = sample.volumes[step]
+        self.update_length()
+
+
+def note_key(pitch, sample_number):
+    return (sample_number << 8) | pitch
+
+
+class CompiledTrack:
+    def __init__(self, track):
+        self.track = track
+        self.notes = {}
+        for pattern_index, pattern in enumerate(track.patterns):
+            for row_index in range(0, len(pattern)):
+                self.update_cell(pattern_index, row_index)
+
+    def get_note(self, pitch, sample_number):
+        key = note_key(pitch, sample_number)
+        note = self.notes.get(key)
+        if note is None:
+            note = CompiledNote(self.track.samples[sample_number], pitch)
+            self.notes[key] = note
+        return note
+
+    def update_cell(self, pattern_index, row_index):
+        # compile whatever the cell at this position can play; called whenever
+        # the cell is edited
+        pattern = self.track.patterns[pattern_index]
+        pitch = pattern.pitches[row_index]
+        if pitch == NO_PITCH:
+            return
+
+        sample_number = pattern.sample_numbers[row_index]
+        if sample_number != 0:
+            self.get_note(pitch, sample_number)
+        else:
+            # the row keeps whichever sample the channel last played
+            for other_sample_number in pattern.sample_numbers:
+                if other_sample_number != 0:
+                    self.get_note(pitch, other_sample_number)
+
+    def invalidate_sample(self, sample_number):
+        # re-render every note of a sample after its envelopes are edited
+        sample = self.track.samples[sample_number]
+        for key, note in self.notes.items():
+            if key >> 8 == sample_number:
+                note.update(sample)
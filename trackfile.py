@@ -0,0 +1,168 @@
+# Compact binary track format.
+#
+# All integers are little-endian. The file consists of:
+#
+#   header      HEADER_FORMAT: magic, version, tempo, sample count, pattern
+#               count, size of the byte section, size of the frequency section
+#   bytes       for each sample: number, waveform, 32 volumes
+#               for each pattern: row count (16 bits), default pitch, default
+#               sample, label length, pitches (NO_PITCH for none), sample
+#               numbers, effects, effect parameters, label (UTF-8)
+#               chain count (16 bits), then for each chain: length and pattern
+#               indexes (16 bits each)
+#               BPM in hundredths (16 bits, 0 if the track uses a tempo in
+#               ticks), rows per beat
+#               padded to an even length
+#   frequencies for each sample: 32 signed 16-bit frequency offsets
+#
+# The loader reads each section into a single buffer, and the patterns and
+# sample envelopes of the resulting Track are memoryview slices of those
+# buffers rather than separate objects.
+
+from array import array
+import io
+import struct
+
+from .track import ENVELOPE_LENGTH, NO_PITCH, Pattern, Sample, Track
+
+MAGIC = b'BBTK'
+VERSION = 1
+HEADER_FORMAT = '<4sBBBHIH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+def dump(data, f):
+    # write a track, given as the output of Track.to_json, to a binary file
+    samples = sorted((int(number), sample) for (number, sample) in data['samples'].items())
+    byte_data = bytearray()
+    frequencies = array('h')
+
+    for number, sample in samples:
+        byte_data.append(number)
+        byte_data.append(sample['waveform'])
+        byte_data.extend(bytes(sample['volumes']))
+        frequencies.extend(array('h', sample['frequencies']))
+
+    for pattern in data['patterns']:
+        label = pattern.get('label', "").encode('utf-8')
+        rows = pattern['rows']
+        byte_data.extend(struct.pack(
+            '<HBBB', len(rows), pattern['default_pitch'], pattern['default_sample'], len(label)
+        ))
+        byte_data.extend(bytes([NO_PITCH if row[0] is None else row[0] for row in rows]))
+        byte_data.extend(bytes([row[1] for row in rows]))
+        byte_data.extend(bytes([row[2] if len(row) > 2 else 0 for row in rows]))
+        byte_data.extend(bytes([row[3] if len(row) > 3 else 0 for row in rows]))
+        byte_data.extend(label)
+
+    chains = data.get('chains')
+    if chains is None:
+        chains = [[i] for i in range(0, len(data['patterns']))]
+    byte_data.extend(struct.pack('<H', len(chains)))
+    for chain in chains:
+        byte_data.extend(struct.pack('<H', len(chain)))
+        byte_data.extend(struct.pack('<%dH' % len(chain), *chain))
+
+    bpm = data.get('bpm')
+    byte_data.extend(struct.pack('<HB', 0 if bpm is None else round(bpm * 100), data.get('rows_per_beat', 4)))
+
+    if len(byte_data) % 2:
+        byte_data.append(0)
+
+    f.write(struct.pack(
+        HEADER_FORMAT, MAGIC, VERSION, data['tempo'], len(samples), len(data['patterns']),
+        len(byte_data), len(frequencies) * 2
+    ))
+    f.write(byte_data)
+    f.write(frequencies)
+
+
+def read_header(f):
+    # returns (tempo, sample_count, pattern_count, bytes_size, frequencies_size)
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        raise ValueError("not a track file")
+    magic, version, *fields = struct.unpack(HEADER_FORMAT, header)
+    if magic != MAGIC:
+        raise ValueError("not a track file")
+    if version != VERSION:
+        raise ValueError("unsupported track file version %d" % version)
+    return fields
+
+
+def load(f):
+    # read a track from a binary file, straight into its backing buffers
+    tempo, sample_count, pattern_count, bytes_size, frequencies_size = read_header(f)
+    byte_data = bytearray(bytes_size)
+    f.readinto(byte_data)
+    frequencies = array('h', bytes(frequencies_size))
+    f.readinto(frequencies)
+    return _build_track(tempo, sample_count, pattern_count, byte_data, frequencies)
+
+
+def loads(buffer):
+    return load(io.BytesIO(buffer))
+
+
+def _build_track(tempo, sample_count, pattern_count, byte_data, frequencies):
+    data = memoryview(byte_data)
+    frequencies = memoryview(frequencies)
+    offset = 0
+
+    samples = {}
+    for index in range(0, sample_count):
+        number = data[offset]
+        waveform = data[offset + 1]
+        offset += 2
+        samples[number] = Sample(
+            waveform=waveform,
+            volumes=data[offset:offset + ENVELOPE_LENGTH],
+            frequencies=frequencies[index * ENVELOPE_LENGTH:(index + 1) * ENVELOPE_LENGTH],
+        )
+        offset += ENVELOPE_LENGTH
+
+    patterns = []
+    for _ in range(0, pattern_count):
+        row_count, default_pitch, default_sample, label_length = struct.unpack_from(
+            '<HBBB', data, offset
+        )
+        offset += 5
+        pitches = data[offset:offset + row_count]
+        offset += row_count
+        sample_numbers = data[offset:offset + row_count]
+        offset += row_count
+        effects = data[offset:offset + row_count]
+        offset += row_count
+        effect_params = data[offset:offset + row_count]
+        offset += row_count
+        label = str(bytes(data[offset:offset + label_length]), 'utf-8')
+        offset += label_length
+        patterns.append(Pattern(
+            pitches=pitches,
+            sample_numbers=sample_numbers,
+            default_sample=default_sample,
+            default_pitch=default_pitch,
+            label=label,
+            effects=effects,
+            effect_params=effect_params,
+        ))
+
+    chain_count = struct.unpack_from('<H', data, offset)[0]
+    offset += 2
+    chains = []
+    for _ in range(0, chain_count):
+        length = struct.unpack_from('<H', data, offset)[0]
+        offset += 2
+        # copied, as the indexes aren't aligned in the byte section
+        chains.append(array('H', bytes(data[offset:offset + length * 2])))
+        offset += length * 2
+
+    centibpm, rows_per_beat = struct.unpack_from('<HB', data, offset)
+    bpm = None
+    if centibpm:
+        bpm = centibpm / 100
+
+    return Track(
+        samples=samples, patterns=patterns, tempo=tempo, chains=chains, bpm=bpm,
+        rows_per_beat=rows_per_beat,
+    )
@@ -1,6 +1,10 @@
 import buttons
 import display
-import machine
+import micropython
+import utime
+
+from .events import EventQueue
+from .timers import IdleTimer
 
 NAMED_BUTTONS = [
     (buttons.BTN_A, 'a'),
@@ -9,62 +13,329 @@ NAMED_BUTTONS = [
     (buttons.BTN_SELECT, 'SELECT'),
 ]
 
+
+# number of text sizes remembered by Screen before it starts again
+TEXT_CACHE_SIZE = 64
+
+
+def rgb565(colour):
+    return ((colour >> 8) & 0xf800) | ((colour >> 5) & 0x07e0) | ((colour >> 3) & 0x001f)
+
+
+class Sprite:
+    # A small image made of rectangles, given as (x, y, width, height, filled,
+    # colour) relative to its top left corner and drawn in order. Where the
+    # display has drawRaw, it is pre-rendered on first use (in the display's
+    # native RGB565 format, most significant byte first) and drawn in one
+    # call; otherwise its rectangles are drawn one by one.
+    def __init__(self, width, height, rects):
+        self.width = width
+        self.height = height
+        self.rects = rects
+        self.pixels = None
+
+    def render(self):
+        width = self.width
+        pixels = bytearray(width * self.height * 2)
+        for x, y, rect_width, rect_height, filled, colour in self.rects:
+            value = rgb565(colour)
+            high = value >> 8
+            low = value & 0xff
+            right = x + rect_width - 1
+            bottom = y + rect_height - 1
+            for row in range(y, bottom + 1):
+                for column in range(x, right + 1):
+                    if filled or row == y or row == bottom or column == x or column == right:
+                        index = (row * width + column) * 2
+                        pixels[index] = high
+                        pixels[index + 1] = low
+        self.pixels = pixels
+
+
+class Screen:
+    # Wraps the display module, keeping track of the rectangle drawn to since
+    # the last flush so that flushing can be skipped when nothing has changed,
+    # or limited to the area that did change if the display driver allows it.
+    # Also remembers the size of text it has measured, so that the font is
+    # only measured once for each label or value shown.
+    def __init__(self):
+        self.screen_width = display.width()
+        self.screen_height = display.height()
+        self.partial_flush = True
+        self.raw_blit = hasattr(display, 'drawRaw')
+        self.flush_count = 0
+        self.skipped_flush_count = 0
+        # (width, height) by (text, font)
+        self.text_sizes = {}
+        self._clear_dirty()
+
+    def _clear_dirty(self):
+        self.dirty = False
+        self.dirty_x0 = self.screen_width
+        self.dirty_y0 = self.screen_height
+        self.dirty_x1 = 0
+        self.dirty_y1 = 0
+
+    def mark_dirty(self, x, y, width, height):
+        self.dirty = True
+        self.dirty_x0 = max(0, min(self.dirty_x0, x))
+        self.dirty_y0 = max(0, min(self.dirty_y0, y))
+        self.dirty_x1 = min(self.screen_width, max(self.dirty_x1, x + width))
+        self.dirty_y1 = min(self.screen_height, max(self.dirty_y1, y + height))
+
+    def width(self):
+        return self.screen_width
+
+    def height(self):
+        return self.screen_height
+
+    def text_size(self, text, *font):
+        key = (text, font)
+        size = self.text_sizes.get(key)
+        if size is None:
+            if len(self.text_sizes) >= TEXT_CACHE_SIZE:
+                self.text_sizes.clear()
+            size = (display.getTextWidth(text, *font), display.getTextHeight(text, *font))
+            self.text_sizes[key] = size
+        return size
+
+    def getTextWidth(self, text, *font):
+        return self.text_size(text, *font)[0]
+
+    def getTextHeight(self, text, *font):
+        return self.text_size(text, *font)[1]
+
+    def drawFill(self, colour):
+        display.drawFill(colour)
+        self.mark_dirty(0, 0, self.screen_width, self.screen_height)
+
+    def drawRect(self, x, y, width, height, filled, colour):
+        display.drawRect(x, y, width, height, filled, colour)
+        self.mark_dirty(x, y, width, height)
+
+    def drawText(self, x, y, text, colour, *font):
+        display.drawText(x, y, text, colour, *font)
+        width, height = self.text_size(text, *font[:1])
+        self.mark_dirty(x, y, width, height)
+
+    def drawSprite(self, x, y, sprite):
+        if self.raw_blit:
+            if sprite.pixels is None:
+                sprite.render()
+            try:
+                display.drawRaw(x, y, sprite.width, sprite.height, sprite.pixels)
+            except (TypeError, ValueError):
+                # driver doesn't take raw pixels after all
+                self.raw_blit = False
+        if not self.raw_blit:
+            for rect_x, rect_y, width, height, filled, colour in sprite.rects:
+                display.drawRect(x + rect_x, y + rect_y, width, height, filled, colour)
+        self.mark_dirty(x, y, sprite.width, sprite.height)
+
+    def flush(self):
+        if not self.dirty:
+            self.skipped_flush_count += 1
+            return
+
+        is_full_screen = (
+            self.dirty_x0 == 0 and self.dirty_y0 == 0
+            and self.dirty_x1 == self.screen_width and self.dirty_y1 == self.screen_height
+        )
+        if self.partial_flush and not is_full_screen:
+            try:
+                display.flush(self.dirty_x0, self.dirty_y0, self.dirty_x1 - 1, self.dirty_y1 - 1)
+            except TypeError:
+                # driver only supports flushing the whole screen
+                self.partial_flush = False
+                display.flush()
+        else:
+            display.flush()
+
+        self.flush_count += 1
+        self._clear_dirty()
+
+
+screen = Screen()
+
+
+JOYSTICK_BUTTONS = (buttons.BTN_UP, buttons.BTN_DOWN, buttons.BTN_LEFT, buttons.BTN_RIGHT)
+
+# period of the joystick repeat timer; once the repeat interval is shorter
+# than this, each tick posts all the moves that fell due since the last one
+REPEAT_MS = 100
+
+
 class Controller:
-    def __init__(self, timer_id=0):
-        self.timer = machine.Timer(timer_id)
+    # Button callbacks and the joystick repeat timer only queue up input
+    # events, and process_events hands them to the active view in one go
+    # before flushing the screen once. Joystick events are queued as
+    # (button, number of moves), and consecutive moves in the same direction
+    # are merged into one, so that a view that falls behind catches up in one
+    # step instead of overshooting. Other buttons are queued as
+    # (button, pressed).
+    #
+    # Holding the joystick repeats the move after repeat_delay_ms, then every
+    # repeat_interval_ms, with the interval shrinking to repeat_acceleration
+    # percent of itself on each repeat, down to repeat_min_interval_ms.
+    def __init__(
+        self, timer_id=0, repeat_delay_ms=600, repeat_interval_ms=100,
+        repeat_min_interval_ms=40, repeat_acceleration=85
+    ):
         self.current_button = None
-        self.ticks_since_press = 0
-        self.debounce_ticks = 5
+        self.repeat_delay_ms = repeat_delay_ms
+        self.repeat_start_interval_ms = repeat_interval_ms
+        self.repeat_min_interval_ms = repeat_min_interval_ms
+        self.repeat_acceleration = repeat_acceleration
+        self.repeat_interval_ms = repeat_interval_ms
+        self.next_repeat_ms = 0
         self.active_view = None
 
-        def tick(t):
-            if self.current_button is not None:
-                self.ticks_since_press += 1
-                if self.ticks_since_press > self.debounce_ticks and self.active_view:
-                    self.active_view.on_move(self.current_button)
+        # repeats moves while the joystick is held; only armed while it is
+        self.timer = IdleTimer(timer_id, REPEAT_MS, self.repeat_tick)
 
-        self.timer.init(period=100, callback=tick)
+        # When deferred, process_events is left to the caller (see
+        # runtime.Runtime) rather than scheduled after each input event
+        self.deferred = False
+        self.input_events = EventQueue()
+        self.process_scheduled = False
+        self._process_events = self.process_events
+        self.reset_stats()
 
-        for button in (buttons.BTN_UP, buttons.BTN_DOWN, buttons.BTN_LEFT, buttons.BTN_RIGHT):
+        for button in JOYSTICK_BUTTONS:
             self._add_joystick_event_handler(button)
 
+        self.button_names = {}
         for button, name in NAMED_BUTTONS:
+            self.button_names[button] = name
             self._add_button_event_handler(button, name)
+        # the active view's on_press_* / on_release_* methods, by button; see
+        # set_view
+        self.press_handlers = {}
+        self.release_handlers = {}
+
+    def reset_stats(self):
+        # time from the oldest input event of a batch being queued to the
+        # screen flush that shows its effect
+        self.pending_since_us = 0
+        self.batch_count = 0
+        self.total_latency_us = 0
+        self.max_latency_us = 0
+        # moves merged into the move queued before them
+        self.coalesced_moves = 0
+
+    def now_us(self):
+        return utime.ticks_us()
+
+    def average_latency_us(self):
+        if not self.batch_count:
+            return 0
+        return self.total_latency_us // self.batch_count
+
+    def set_deferred(self):
+        # leave it to the caller to call process_events, and repeat_tick every
+        # REPEAT_MS
+        self.deferred = True
+        self.timer.disarm()
+        self.timer = None
+
+    def post_input(self, button, arg):
+        if self.input_events.count == 0:
+            self.pending_since_us = self.now_us()
+        if button in self.button_names:
+            posted = self.input_events.post(button, arg)
+        else:
+            count = self.input_events.count
+            posted = self.input_events.post_or_merge(button, arg)
+            if posted and self.input_events.count == count:
+                self.coalesced_moves += arg
+        if posted and not self.deferred and not self.process_scheduled:
+            try:
+                micropython.schedule(self._process_events, None)
+                self.process_scheduled = True
+            except RuntimeError:
+                # schedule queue is full; the next event will try again
+                pass
+
+    def repeat_tick(self, _=None):
+        if self.current_button is None:
+            return
+        now = utime.ticks_ms()
+        if utime.ticks_diff(now, self.next_repeat_ms) > REPEAT_MS:
+            # fell behind; repeats from before the last tick are not made up for
+            self.next_repeat_ms = utime.ticks_add(now, -REPEAT_MS)
+
+        count = 0
+        while utime.ticks_diff(now, self.next_repeat_ms) >= 0:
+            count += 1
+            self.next_repeat_ms = utime.ticks_add(self.next_repeat_ms, self.repeat_interval_ms)
+            self.repeat_interval_ms = max(
+                self.repeat_min_interval_ms,
+                self.repeat_interval_ms * self.repeat_acceleration // 100,
+            )
+        if count:
+            self.post_input(self.current_button, count)
+
+    def on_joystick(self, button, pressed):
+        if pressed:
+            self.current_button = button
+            self.repeat_interval_ms = self.repeat_start_interval_ms
+            self.next_repeat_ms = utime.ticks_add(utime.ticks_ms(), self.repeat_delay_ms)
+            if self.timer is not None:
+                self.timer.arm()
+            self.post_input(button, 1)
+        elif self.current_button == button:
+            self.current_button = None
+            if self.timer is not None:
+                self.timer.disarm()
+
+    def handle_button(self, button, pressed):
+        if self.active_view:
+            if pressed:
+                self.press_handlers[button]()
+            else:
+                self.release_handlers[button]()
+
+    def process_events(self, _=None):
+        self.process_scheduled = False
+        had_input = self.input_events.count > 0
+        while self.input_events.count:
+            button, arg = self.input_events.pop()
+            if button in self.button_names:
+                self.handle_button(button, arg)
+            elif self.active_view:
+                self.active_view.on_move(button, arg)
+        screen.flush()
+
+        if had_input:
+            latency = utime.ticks_diff(self.now_us(), self.pending_since_us)
+            self.batch_count += 1
+            self.total_latency_us += latency
+            if latency > self.max_latency_us:
+                self.max_latency_us = latency
 
     def _add_joystick_event_handler(self, button):
         def event_handler(pressed):
-            if pressed:
-                self.current_button = button
-                self.ticks_since_press = 0
-                if self.active_view:
-                    self.active_view.on_move(self.current_button)
-            elif self.current_button == button:
-                self.current_button = None
-
-            display.flush()  # TODO: only flush if a screen update happened
+            self.on_joystick(button, pressed)
 
         buttons.attach(button, event_handler)
 
     def _add_button_event_handler(self, button, name):
-        press_fn_name = "on_press_%s" % name
-        release_fn_name = "on_release_%s" % name
         def on_button(pressed):
-            if self.active_view:
-                if pressed:
-                    getattr(self.active_view, press_fn_name)()
-                else:
-                    getattr(self.active_view, release_fn_name)()
-
-                display.flush()  # TODO: only flush if a screen update happened
+            self.post_input(button, 1 if pressed else 0)
 
         buttons.attach(button, on_button)
 
-
     def set_view(self, view):
+        if self.active_view is not None:
+            self.active_view.deactivate()
         self.active_view = view
+        # look the handlers up once here, rather than by name on every press
+        for button, name in NAMED_BUTTONS:
+            self.press_handlers[button] = getattr(view, "on_press_%s" % name)
+            self.release_handlers[button] = getattr(view, "on_release_%s" % name)
         view.activate()
         view.draw()
-        display.flush()
+        screen.flush()
 
 
 class Focusable:
@@ -75,19 +346,19 @@ class Focusable:
         self.focused = False
         super().__init__()
 
-    def on_move(self, button):
+    def on_move(self, button, count=1):
         pass
 
     def _hide_help(self):
         if self.help_text:
-            display.drawRect(
-                0, display.height() - 16, display.width(), 16, True, 0xffffff
+            screen.drawRect(
+                0, screen.height() - 16, screen.width(), 16, True, 0xffffff
             )
 
     def _show_help(self):
         if self.help_text:
-            display.drawText(
-                0, display.height() - 16, self.help_text, 0x000000
+            screen.drawText(
+                0, screen.height() - 16, self.help_text, 0x000000
             )
 
     def draw(self):
@@ -116,70 +387,226 @@ for button, name in NAMED_BUTTONS:
     _add_focusable_button_method("on_release_%s" % name)
 
 
+def _nearest(values, value):
+    # index of the entry of the sorted list values closest to value
+    low = 0
+    high = len(values)
+    while low < high:
+        middle = (low + high) // 2
+        if values[middle] < value:
+            low = middle + 1
+        else:
+            high = middle
+    if low > 0 and (low == len(values) or value - values[low - 1] <= values[low] - value):
+        return low - 1
+    return low
+
+
+class FocusIndex:
+    # The focusable widgets of a container, arranged by where they are on
+    # screen: in rows of widgets whose bounding boxes overlap vertically, top
+    # to bottom, and left to right within a row. Moving up or down goes to the
+    # widget in the row above or below that is closest horizontally, found by
+    # binary search; moving left or right goes to the next widget in the row,
+    # carrying on into the row before or after at either end.
+    def __init__(self, widgets):
+        # to tell when the container's widgets list has changed
+        self.widgets = widgets
+        self.count = len(widgets)
+
+        boxes = []
+        for list_index, widget in enumerate(widgets):
+            if widget.focusable:
+                x, y, width, height = widget.bounds()
+                boxes.append((y, x, width, height, list_index))
+        boxes.sort()
+
+        self.rows = []
+        # horizontal centres of the widgets of each row, in order
+        self.row_centres = []
+        # (row, column, index in widgets) by widget
+        self.positions = {}
+        # the box around all of the widgets
+        self.bounds = None
+        row = None
+        row_bottom = 0
+        for y, x, width, height, list_index in boxes:
+            if row is None or y >= row_bottom:
+                row = []
+                self.rows.append(row)
+                row_bottom = y + height
+            else:
+                row_bottom = max(row_bottom, y + height)
+            row.append((x + width // 2, list_index))
+
+            if self.bounds is None:
+                self.bounds = (x, y, x + width, y + height)
+            else:
+                x0, y0, x1, y1 = self.bounds
+                self.bounds = (
+                    min(x0, x), min(y0, y), max(x1, x + width), max(y1, y + height)
+                )
+
+        for row_number, row in enumerate(self.rows):
+            row.sort()
+            self.row_centres.append([centre for (centre, _) in row])
+            for column, (_, list_index) in enumerate(row):
+                widget = widgets[list_index]
+                row[column] = widget
+                self.positions[widget] = (row_number, column, list_index)
+
+        if self.bounds is not None:
+            x0, y0, x1, y1 = self.bounds
+            self.bounds = (x0, y0, x1 - x0, y1 - y0)
+
+    def list_index(self, widget):
+        return self.positions[widget][2]
+
+    def first(self):
+        return self.rows[0][0] if self.rows else None
+
+    def last(self):
+        return self.rows[-1][-1] if self.rows else None
+
+    def next(self, widget, wrap=False):
+        # the widget after this one, reading left to right and top to bottom
+        if widget not in self.positions:
+            return self.first()
+        row, column, _ = self.positions[widget]
+        if column + 1 < len(self.rows[row]):
+            return self.rows[row][column + 1]
+        if row + 1 < len(self.rows):
+            return self.rows[row + 1][0]
+        return self.first() if wrap else None
+
+    def previous(self, widget, wrap=False):
+        if widget not in self.positions:
+            return self.last()
+        row, column, _ = self.positions[widget]
+        if column > 0:
+            return self.rows[row][column - 1]
+        if row > 0:
+            return self.rows[row - 1][-1]
+        return self.last() if wrap else None
+
+    def vertical(self, widget, step, wrap=False):
+        # the closest widget in the row step rows away
+        if widget not in self.positions:
+            return self.first() if step > 0 else self.last()
+        row, column, _ = self.positions[widget]
+        centre = self.row_centres[row][column]
+        row += step
+        if not 0 <= row < len(self.rows):
+            if not wrap:
+                return None
+            row %= len(self.rows)
+        return self.rows[row][_nearest(self.row_centres[row], centre)]
+
+    def move(self, widget, button, wrap=False):
+        # the widget that a move of the joystick from this one goes to
+        if button == buttons.BTN_UP:
+            return self.vertical(widget, -1, wrap)
+        elif button == buttons.BTN_DOWN:
+            return self.vertical(widget, 1, wrap)
+        elif button == buttons.BTN_LEFT:
+            return self.previous(widget, wrap)
+        else:
+            return self.next(widget, wrap)
+
+
 class WidgetContainer:
+    # Containers can be nested: a container in another's widgets takes the
+    # focus like any other widget, and hands joystick moves that would take
+    # the focus outside of it back to its parent.
     widgets = []
     wrap_focus = False
 
     def __init__(self):
-        if self.widgets:
-            self.active_widget = self.widgets[0]
-            # TODO: updating active_widget_index if the widgets list is modified
-            self.active_widget_index = 0
-        else:
-            self.active_widget = None
-            self.active_widget_index = None
+        self.focus_index = None
+        self.active_widget = None
+        self.active_widget_index = None
+        index = self.get_focus_index()
+        self.active_widget = index.first()
+        self.active_widget_index = (
+            None if self.active_widget is None else index.list_index(self.active_widget)
+        )
 
-    def get_next_focusable_widget(self):
-        index = self.active_widget_index
-        checked_count = 0
-        while (checked_count < len(self.widgets)):
-            index += 1
-            if index >= len(self.widgets):
-                if self.wrap_focus:
-                    index = 0
-                else:
-                    return None, None
-
-            widget = self.widgets[index]
-            if widget.focusable:
-                return index, widget
+    def get_focus_index(self):
+        # built again whenever the widgets list is replaced or changes length;
+        # call invalidate_focus_index after any other change to it, or after
+        # moving its widgets
+        index = self.focus_index
+        if index is None or index.widgets is not self.widgets or index.count != len(self.widgets):
+            index = FocusIndex(self.widgets)
+            self.focus_index = index
+            if self.active_widget_index is not None:
+                self.active_widget_index = index.positions.get(
+                    self.active_widget, (None, None, None)
+                )[2]
+        return index
+
+    def invalidate_focus_index(self):
+        self.focus_index = None
+
+    @property
+    def focusable(self):
+        return self.get_focus_index().first() is not None
+
+    def bounds(self):
+        return self.get_focus_index().bounds
+
+    def _with_list_index(self, widget):
+        if widget is None:
+            return None, None
+        return self.get_focus_index().list_index(widget), widget
 
-        return None, None
+    def get_next_focusable_widget(self):
+        return self._with_list_index(
+            self.get_focus_index().next(self.active_widget, self.wrap_focus)
+        )
 
     def get_previous_focusable_widget(self):
-        index = self.active_widget_index
-        checked_count = 0
-        while (checked_count < len(self.widgets)):
-            index -= 1
-            if index < 0:
-                if self.wrap_focus:
-                    index = len(self.widgets) - 1
-                else:
-                    return None, None
-
-            widget = self.widgets[index]
-            if widget.focusable:
-                return index, widget
+        return self._with_list_index(
+            self.get_focus_index().previous(self.active_widget, self.wrap_focus)
+        )
 
-        return None, None
+    def get_focusable_widget_towards(self, button):
+        return self._with_list_index(
+            self.get_focus_index().move(self.active_widget, button, self.wrap_focus)
+        )
 
-    def on_move(self, button):
+    def on_move(self, button, count=1):
+        # a move of count steps that takes focus off the active widget moves
+        # the focus on by one widget only
         if self.active_widget:
-            keep_focus = self.active_widget.on_move(button)
+            keep_focus = self.active_widget.on_move(button, count)
             if keep_focus:
                 return True
-            else:
-                self.active_widget.on_blur(button)
-                if button in (buttons.BTN_UP, buttons.BTN_LEFT):
-                    self.active_widget_index, self.active_widget = self.get_previous_focusable_widget()
-                else:
-                    self.active_widget_index, self.active_widget = self.get_next_focusable_widget()
-
-                if self.active_widget:
-                    self.active_widget.on_focus(button)
-                    return True
-                else:
-                    return False
+
+            index, widget = self.get_focusable_widget_towards(button)
+            if widget is None:
+                # leave it to the parent container to move the focus on
+                return False
+            self.active_widget.on_blur(button)
+            self.active_widget_index, self.active_widget = index, widget
+            self.active_widget.on_focus(button)
+            return True
+
+    def on_focus(self, button=None):
+        # entering a nested container from below or the right focuses its last
+        # widget, and otherwise its first
+        index = self.get_focus_index()
+        if button in (buttons.BTN_UP, buttons.BTN_LEFT):
+            widget = index.last()
+        else:
+            widget = index.first()
+        self.active_widget_index, self.active_widget = self._with_list_index(widget)
+        if self.active_widget:
+            self.active_widget.on_focus(button)
+
+    def on_blur(self, button=None):
+        if self.active_widget:
+            self.active_widget.on_blur(button)
 
     def draw(self):
         for widget in self.widgets:
@@ -209,13 +636,17 @@ class View(WidgetContainer):
         pass
 
     def draw(self):
-        display.drawFill(display.WHITE)
+        screen.drawFill(display.WHITE)
         super().draw()
 
 
 class Widget:
     focusable = False
 
+    def bounds(self):
+        # (x, y, width, height) on screen, for moving the focus between widgets
+        return self.x, self.y, self.width, self.height
+
     def draw(self):
         pass
 
@@ -228,28 +659,29 @@ class Button(Focusable, Widget):
         self.y = y
         self.width = 32
         self.height = 16
-        self.label_width = display.getTextWidth(self.label)
-        self.label_height = display.getTextHeight(self.label)
+        self.label_width = screen.getTextWidth(self.label)
+        self.label_height = screen.getTextHeight(self.label)
 
-    def set_label(self, text):
+    def set_label(self, text, redraw=True):
         self.label = text
-        self.label_width = display.getTextWidth(self.label)
-        self.label_height = display.getTextHeight(self.label)
-        self.draw()
+        self.label_width = screen.getTextWidth(self.label)
+        self.label_height = screen.getTextHeight(self.label)
+        if redraw:
+            self.draw()
 
     def draw(self):
         if self.focused:
-            display.drawRect(self.x, self.y, self.width, self.height, True, 0x000000)
-            display.drawText(
+            screen.drawRect(self.x, self.y, self.width, self.height, True, 0x000000)
+            screen.drawText(
                 self.x + int(self.width / 2 - self.label_width / 2),
                 self.y + int(self.height / 2 - self.label_height / 2),
                 self.label,
                 0xffffff,
             )
         else:
-            display.drawRect(self.x, self.y, self.width, self.height, True, 0xffffff)
-            display.drawRect(self.x, self.y, self.width, self.height, False, 0x000000)
-            display.drawText(
+            screen.drawRect(self.x, self.y, self.width, self.height, True, 0xffffff)
+            screen.drawRect(self.x, self.y, self.width, self.height, False, 0x000000)
+            screen.drawText(
                 self.x + int(self.width / 2 - self.label_width / 2),
                 self.y + int(self.height / 2 - self.label_height / 2),
                 self.label,
@@ -270,51 +702,58 @@ class NumberInput(Focusable, Widget):
         self.x = x
         self.y = y
         self.height = 16
-        self.label_width = display.getTextWidth(self.label)
-        self.value_width = display.getTextWidth(str(self.value))
+        self.label_width = screen.getTextWidth(self.label)
+        self.value_width = screen.getTextWidth(str(self.value))
+        self.width = self.label_width + 5 + 32
         self.holding_button = False
 
         self.on_change = on_change
 
+    def set_value(self, value):
+        self.value = value
+        self.value_width = screen.getTextWidth(str(self.value))
+        self.draw()
+
     def on_press_a(self):
         self.holding_button = True
 
     def on_release_a(self):
         self.holding_button = False
 
-    def on_move(self, button):
+    def on_move(self, button, count=1):
         if self.holding_button:
+            new_value = self.value
             if button == buttons.BTN_UP:
-                new_value = self.value + 1
+                new_value = self.value + count
                 if self.max_value is not None and new_value > self.max_value:
                     new_value = self.max_value
             elif button == buttons.BTN_DOWN:
-                new_value = self.value - 1
+                new_value = self.value - count
                 if self.min_value is not None and new_value < self.min_value:
                     new_value = self.min_value
 
             if new_value != self.value:
                 self.value = new_value
-                self.value_width = display.getTextWidth(str(self.value))
+                self.value_width = screen.getTextWidth(str(self.value))
                 self.draw()
                 if self.on_change:
                     self.on_change(self.value)
             return True
 
     def draw(self):
-        display.drawText(self.x, self.y, self.label, 0x000000)
+        screen.drawText(self.x, self.y, self.label, 0x000000)
         if self.focused:
-            display.drawRect(
+            screen.drawRect(
                 self.x + self.label_width + 5, self.y, 32, self.height, True, 0x0fffff
             )
         else:
-            display.drawRect(
+            screen.drawRect(
                 self.x + self.label_width + 5, self.y, 32, self.height, True, 0xffffff
             )
 
-        display.drawRect(
+        screen.drawRect(
             self.x + self.label_width + 5, self.y, 32, self.height, False, 0x000000
         )
         right_x = self.x + self.label_width + 5 + 32
-        display.drawText(right_x - self.value_width - 2, self.y, str(self.value), 0x000000)
+        screen.drawText(right_x - self.value_width - 2, self.y, str(self.value), 0x000000)
         super().draw()
\ No newline at end of file